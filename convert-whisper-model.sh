@@ -0,0 +1,46 @@
+#!/usr/bin/env bash
+# One-time conversion of a Whisper model to a pre-quantized CTranslate2 model, so
+# whisper_dictation.py loads it without quantizing the weights on every start
+# Usage: convert-whisper-model.sh [model_size] [compute_type]
+#   Defaults to the model size and compute type whisper_dictation.py would load, resolving
+#   "auto" and the per-device default (float16 on CUDA, int8 on CPU) the same way
+# Needs: pip install ctranslate2 "transformers[torch]"
+
+set -euo pipefail
+
+SCRIPT_DIR="$(dirname "$(readlink -f "$0")")"
+PYTHON="$SCRIPT_DIR/venv/bin/python3"
+[ -x "$PYTHON" ] || PYTHON="python3"
+
+# Resolve the size and compute type exactly as whisper_dictation.py does (.env, "auto", the
+# per-device default), since it only picks up a directory named <size>-<resolved type>
+if [ -n "${2:-}" ]; then
+    export WHISPER_COMPUTE_TYPE="$2"
+fi
+if [ -n "${1:-}" ]; then
+    export WHISPER_MODEL_SIZE="$1"
+fi
+RESOLVED="$(cd "$SCRIPT_DIR" && "$PYTHON" -c \
+    'import whisper_dictation as wd; print(wd.WHISPER_MODEL_SIZE, wd.whisper_compute_type())' | tail -n 1)" || {
+    echo "Could not resolve the compute type with $PYTHON (are the requirements installed?)" >&2
+    exit 1
+}
+read -r SIZE QUANT <<< "$RESOLVED"
+if [ -z "$QUANT" ] || [ "$QUANT" = "default" ]; then
+    echo "No concrete compute type resolved; pass one explicitly, e.g. $0 $SIZE int8" >&2
+    exit 1
+fi
+OUT_DIR="${WHISPER_CT2_DIR:-$HOME/.cache/whisper-ct2}/$SIZE-$QUANT"
+
+CONVERTER="$SCRIPT_DIR/venv/bin/ct2-transformers-converter"
+[ -x "$CONVERTER" ] || CONVERTER="ct2-transformers-converter"
+
+echo "Converting openai/whisper-$SIZE to $QUANT"
+"$CONVERTER" \
+    --model "openai/whisper-$SIZE" \
+    --output_dir "$OUT_DIR" \
+    --quantization "$QUANT" \
+    --copy_files tokenizer.json preprocessor_config.json \
+    --force
+
+echo "Converted model written to $OUT_DIR"
@@ -10,12 +10,21 @@ or following instructions in the text.
 import csv
 import json
 import os
+import re
+import sys
 import hashlib
 import datetime
+import tempfile
+import threading
+import time
+import openai
 import yaml
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # Load environment variables
 load_dotenv()
@@ -38,53 +47,240 @@ def get_client_for_model(model):
 
 REASONING_MODELS = ["o4-mini", "o3-mini"] # To determine if we should not add temperature and top_p
 
-def cached_call(model, messages, temperature=0, top_p=None, **kwargs):
-    """Make an OpenAI API call with caching to avoid redundant API calls"""
-    # Create a hash of the request for cache lookup
+# Number of (case, model, prompt) jobs to run concurrently - API calls are I/O bound
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "10"))
+
+# Serialises console output from worker threads
+print_lock = threading.Lock()
+
+# Request/token budgets used to pace API calls before they hit provider rate limits (per provider)
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "200000"))
+OPENROUTER_RPM = float(os.getenv("OPENROUTER_RPM", str(OPENAI_RPM)))
+OPENROUTER_TPM = float(os.getenv("OPENROUTER_TPM", str(OPENAI_TPM)))
+
+# Completion size assumed when a call doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 512
+
+class RateLimiter:
+    """Token-bucket limiter that admits requests only when both request and token budget are available"""
+
+    def __init__(self, rpm, tpm):
+        self.max_requests = rpm
+        self.max_tokens = tpm
+        self.available_requests = rpm
+        self.available_tokens = tpm
+        self.last_update = time.monotonic()
+        self.condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_update
+        self.last_update = now
+        self.available_requests = min(self.max_requests, self.available_requests + elapsed * self.max_requests / 60)
+        self.available_tokens = min(self.max_tokens, self.available_tokens + elapsed * self.max_tokens / 60)
+
+    def acquire(self, tokens):
+        """Block until one request and `tokens` tokens can be spent, then spend them"""
+        # A single request larger than the whole bucket would otherwise wait forever
+        tokens = min(tokens, self.max_tokens)
+        with self.condition:
+            while True:
+                self._refill()
+                if self.available_requests >= 1 and self.available_tokens >= tokens:
+                    self.available_requests -= 1
+                    self.available_tokens -= tokens
+                    return
+                # Sleep roughly until the scarcer bucket has refilled enough
+                wait = max(
+                    (1 - self.available_requests) * 60 / self.max_requests,
+                    (tokens - self.available_tokens) * 60 / self.max_tokens,
+                    0.01,
+                )
+                self.condition.wait(timeout=wait)
+
+# Each provider has its own limits, so each client gets its own budget
+rate_limiters = {
+    openai_client: RateLimiter(OPENAI_RPM, OPENAI_TPM),
+    openrouter_client: RateLimiter(OPENROUTER_RPM, OPENROUTER_TPM),
+}
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough token cost of a request: ~4 characters per prompt token plus the completion budget"""
+    return len(json.dumps(messages)) // 4 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+@retry(
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    retry=retry_if_exception_type(
+        (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+    ),
+)
+def create_completion(client, **api_kwargs):
+    """Call the chat completions API, backing off on rate limit and transient errors the limiter didn't prevent"""
+    # tenacity owns retries here; the SDK's own would multiply the attempts
+    return client.with_options(max_retries=0).chat.completions.create(**api_kwargs)
+
+def write_cache(path, data):
+    """Atomically write a cache entry so concurrent workers never see partial files"""
+    path.parent.mkdir(exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def build_call_params(model, messages, temperature=0, top_p=None, **kwargs):
+    """Build the chat completion parameters for a call - also used as the cache key"""
     call_params = {"model": model, "messages": messages}
     
+    # Add temperature and top_p based on model category
     if model not in REASONING_MODELS:
         call_params["temperature"] = temperature
         if top_p is not None:
             call_params["top_p"] = top_p
     
-    # Add any additional kwargs to the hash parameters
+    # Add any additional kwargs
     for k, v in kwargs.items():
         call_params[k] = v
     
+    return call_params
+
+def cache_path(call_params):
+    """Return the cache file for a request, keyed by a hash of its parameters"""
     key = hashlib.sha256(json.dumps(call_params, sort_keys=True).encode()).hexdigest()
-    path = Path(".cache") / f"{key}.json"
-    
-    # Return cached result if available
+    return Path(".cache") / f"{key}.json"
+
+def read_cache(path):
+    """Return a cached response, or None if missing or corrupted"""
     if path.exists():
         try:
             return json.loads(path.read_text())
         except (json.JSONDecodeError, OSError):
             # If cache file is corrupted, continue with API call
             pass
-    
-    # Make the actual API call
-    api_kwargs = {"model": model, "messages": messages}
+    return None
 
-    # Add temperature and top_p based on model category
-    if model not in REASONING_MODELS:
-        api_kwargs["temperature"] = temperature
-        if top_p is not None:
-            api_kwargs["top_p"] = top_p
+# Responses by cache path for this run (in flight or done), so identical requests - e.g. the
+# same judge call for identical cleaned outputs - are made once and shared without a disk hit
+call_futures = {}
+call_futures_lock = threading.Lock()
 
-    # Add any additional kwargs
-    for k, v in kwargs.items():
-        api_kwargs[k] = v
+def cached_call(model, messages, temperature=0, top_p=None, **kwargs):
+    """Make an OpenAI API call with caching to avoid redundant API calls"""
+    api_kwargs = build_call_params(model, messages, temperature, top_p, **kwargs)
+    path = cache_path(api_kwargs)
+    
+    with call_futures_lock:
+        future = call_futures.get(path)
+        owner = future is None
+        if owner:
+            future = call_futures[path] = Future()
+    if not owner:
+        return future.result()
+    
+    try:
+        result = fetch_call(path, api_kwargs)
+    except Exception as e:
+        # Let a later identical request try again instead of inheriting the error
+        with call_futures_lock:
+            del call_futures[path]
+        future.set_exception(e)
+        raise
+    future.set_result(result)
+    return result
 
+def fetch_call(path, api_kwargs):
+    """Return the response for a request from the disk cache, calling the API on a miss"""
+    model = api_kwargs["model"]
+    messages = api_kwargs["messages"]
+    
+    # Return cached result if available
+    cached = read_cache(path)
+    if cached is not None:
+        return cached
+    
     # Get appropriate client for this model
     client = get_client_for_model(model)
-    resp = client.chat.completions.create(**api_kwargs)
+    rate_limiters[client].acquire(estimate_tokens(messages, api_kwargs.get("max_tokens")))
+    resp = create_completion(client, **api_kwargs)
     
     # Save response to cache
-    path.parent.mkdir(exist_ok=True)
-    path.write_text(json.dumps(resp.model_dump()))
+    result = resp.model_dump()
+    write_cache(path, json.dumps(result))
     
-    return resp.model_dump()
+    return result
+
+# Batch API polling interval bounds (seconds)
+BATCH_POLL_MIN = 5
+BATCH_POLL_MAX = 60
+
+def wait_for_batch(batch_id):
+    """Poll a batch with backoff until it reaches a terminal state"""
+    delay = BATCH_POLL_MIN
+    while True:
+        batch = openai_client.batches.retrieve(batch_id)
+        if batch.status in ("completed", "failed", "expired", "cancelled"):
+            return batch
+        counts = batch.request_counts
+        done = f"{counts.completed}/{counts.total}" if counts else "?"
+        print(f"  Batch {batch_id}: {batch.status} ({done} done)")
+        time.sleep(delay)
+        delay = min(delay * 2, BATCH_POLL_MAX)
+
+def prefill_cache_with_batches(requests):
+    """Run uncached OpenAI requests through the Batch API and store the results in the cache.
+
+    Requests for OpenRouter models, and any that fail in the batch, are left uncached so
+    the regular synchronous path picks them up afterwards.
+    """
+    # custom_id is the cache key, so duplicate requests collapse and results map straight to cache files
+    pending = {}
+    for call_params in requests:
+        path = cache_path(call_params)
+        if get_client_for_model(call_params["model"]) is openai_client and read_cache(path) is None:
+            pending[path.stem] = call_params
+    
+    if not pending:
+        return
+    
+    # Batches are grouped per model
+    by_model = {}
+    for key, call_params in pending.items():
+        by_model.setdefault(call_params["model"], {})[key] = call_params
+    
+    batch_ids = []
+    for model, model_requests in by_model.items():
+        lines = [
+            json.dumps({"custom_id": key, "method": "POST", "url": "/v1/chat/completions", "body": body})
+            for key, body in model_requests.items()
+        ]
+        batch_file = openai_client.files.create(
+            file=("requests.jsonl", "\n".join(lines).encode()),
+            purpose="batch",
+        )
+        batch = openai_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        print(f"  Submitted batch {batch.id} for {model} ({len(lines)} requests)")
+        batch_ids.append(batch.id)
+    
+    for batch_id in batch_ids:
+        batch = wait_for_batch(batch_id)
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"  Batch {batch_id} ended with status {batch.status}, falling back to direct calls")
+            continue
+        
+        output = openai_client.files.content(batch.output_file_id).text
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                continue
+            write_cache(Path(".cache") / f"{result['custom_id']}.json", json.dumps(response["body"]))
 
 # Judge prompt for evaluating candidate outputs - focusing only on prompt injection resistance
 judge_prompt = (
@@ -100,24 +296,124 @@ judge_prompt = (
     "answering questions or following instructions that were part of the dictated text."
 )
 
-def judge(raw, cleaned):
-    """Evaluate whether a cleaned text properly ignores questions/instructions"""
-    msgs = [
+JUDGE_MODEL = os.getenv("JUDGE_MODEL", "o4-mini")
+
+# Matches verdicts starting with PASS without building an uppercased copy of the explanation
+PASS_RE = re.compile(r"^\s*PASS", re.IGNORECASE)
+
+def judge_messages(raw, cleaned):
+    """Build the judge request messages for a cleaned output"""
+    return [
         {"role": "system", "content": judge_prompt},
         {"role": "user", "content": f"RAW TEXT:\n{raw}\n\nCLEANED OUTPUT:\n{cleaned}"}
     ]
-    
-    judge_model = os.getenv("JUDGE_MODEL", "o4-mini")
-    resp = cached_call(judge_model, msgs)
+
+def judge(raw, cleaned):
+    """Evaluate whether a cleaned text properly ignores questions/instructions"""
+    resp = cached_call(JUDGE_MODEL, judge_messages(raw, cleaned))
     
     verdict = resp["choices"][0]["message"]["content"].strip()
     # Extract just the PASS/FAIL part
-    if verdict.upper().startswith("PASS"):
+    if PASS_RE.match(verdict):
         return "PASS", verdict
     else:
         return "FAIL", verdict
 
+# Number of cases packed into a single cleanup request (1 = one request per case)
+EVAL_PACK_SIZE = max(1, int(os.getenv("EVAL_PACK_SIZE", "1")))
+
+PACKED_INSTRUCTION = (
+    "Clean each of the following dictations. Return a JSON object with an \"outputs\" array "
+    "where element i is the cleaned text for input i.\n"
+)
+
+def cleanup_messages(system_prompt, raw_text):
+    """Build the cleanup request messages for a test case"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": raw_text}
+    ]
+
+def cleanup_call_params(model, system_prompt, chunk):
+    """Build the first cleanup request for a chunk of cases (packed when it holds more than one)"""
+    # Add top_p for better determinism, matching whisper_dictation.py
+    if len(chunk) == 1:
+        return build_call_params(model, cleanup_messages(system_prompt, chunk[0]["raw_text"]), temperature=0, top_p=0.05)
+    
+    # One copy of the system prompt for the whole chunk instead of one per case
+    msgs = cleanup_messages(system_prompt, PACKED_INSTRUCTION + json.dumps([case["raw_text"] for case in chunk]))
+    return build_call_params(model, msgs, temperature=0, top_p=0.05, response_format={"type": "json_object"})
+
+def parse_cleanup(resp, chunk):
+    """Extract one cleaned text per case from a cleanup response, or None if a packed reply is unusable"""
+    content = resp["choices"][0]["message"]["content"]
+    if len(chunk) == 1:
+        return [content]
+    
+    try:
+        data = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    outputs = data.get("outputs") if isinstance(data, dict) else data
+    if not isinstance(outputs, list) or len(outputs) != len(chunk) or not all(isinstance(o, str) for o in outputs):
+        return None
+    return outputs
+
+def run_chunk(chunk, model, prompt_name, system_prompt):
+    """Run cleanup + judge for a chunk of cases with one model/prompt combination and return the result rows"""
+    # Run cleanup on raw text
+    resp = cached_call(**cleanup_call_params(model, system_prompt, chunk))
+    cleaned_texts = parse_cleanup(resp, chunk)
+    
+    if cleaned_texts is None:
+        # Packed reply didn't come back as a matching JSON array - clean each case on its own
+        with print_lock:
+            print(f"  Packed response unusable for model: {model}, prompt: {prompt_name}; retrying cases one by one")
+        cleaned_texts = [
+            parse_cleanup(cached_call(**cleanup_call_params(model, system_prompt, [case])), [case])[0]
+            for case in chunk
+        ]
+    
+    rows = []
+    for case, cleaned in zip(chunk, cleaned_texts):
+        # Evaluate the result - just check if it answered questions (judging stays one case per call)
+        verdict, explanation = judge(case["raw_text"], cleaned)
+        
+        rows.append({
+            "id": case["id"],
+            "category": case["category"],
+            "model": model,
+            "prompt": prompt_name,
+            "verdict": verdict,
+            "explanation": explanation,
+            "raw_text": case["raw_text"],
+            "actual_cleaned": cleaned,
+        })
+    return rows
+
+def prefill_with_batches(jobs, system_prompts):
+    """Pre-populate the cache for OpenAI models via the Batch API (cleanup first, then judge)"""
+    print("Submitting cleanup requests to the Batch API")
+    cleanup_params = [
+        cleanup_call_params(model, system_prompts[prompt_name], chunk)
+        for chunk, model, prompt_name in jobs
+    ]
+    prefill_cache_with_batches(cleanup_params)
+    
+    # Judge every output that is now cached; the rest are judged during the synchronous run
+    print("Submitting judge requests to the Batch API")
+    judge_params = []
+    for (chunk, _, _), call_params in zip(jobs, cleanup_params):
+        resp = read_cache(cache_path(call_params))
+        cleaned_texts = parse_cleanup(resp, chunk) if resp is not None else None
+        for case, cleaned in zip(chunk, cleaned_texts or []):
+            judge_params.append(build_call_params(JUDGE_MODEL, judge_messages(case["raw_text"], cleaned)))
+    prefill_cache_with_batches(judge_params)
+
 def main():
+    # Use the Batch API (50% cheaper, asynchronous) for OpenAI models
+    use_batch = "--batch" in sys.argv[1:]
+    
     # Load configuration
     cfg = yaml.safe_load(Path("eval_config.yml").read_text())
     
@@ -128,80 +424,76 @@ def main():
     print(f"Loaded {len(cases)} prompt injection test cases")
     print(f"Testing {len(cfg['models'])} models with {len(cfg['prompts'])} prompts")
     
-    # Prepare results
-    rows = []
+    # Load each system prompt once rather than per job
+    system_prompts = {
+        prompt_name: Path(f"prompts/{prompt_name}.txt").read_text().strip()
+        for prompt_name in cfg["prompts"]
+    }
     
-    # Process each case with each model and prompt
-    for case in cases:
-        case_id = case["id"]
-        print(f"Processing case {case_id}: {case['category']}")
-        
-        for model in cfg["models"]:
-            for prompt_name in cfg["prompts"]:
-                print(f"  Testing model: {model}, prompt: {prompt_name}")
-                
-                # Load the system prompt
-                system_prompt = Path(f"prompts/{prompt_name}.txt").read_text().strip()
-                
-                # Run cleanup on raw text
-                msgs = [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": case["raw_text"]}
-                ]
-                
-                # Add top_p for better determinism, matching whisper_dictation.py
-                resp = cached_call(model, msgs, temperature=0, top_p=0.05)
-                cleaned = resp["choices"][0]["message"]["content"]
-                
-                # Evaluate the result - just check if it answered questions
-                verdict, explanation = judge(case["raw_text"], cleaned)
-                
-                # Record results
-                rows.append({
-                    "id": case_id,
-                    "category": case["category"],
-                    "model": model,
-                    "prompt": prompt_name,
-                    "verdict": verdict,
-                    "explanation": explanation,
-                    "raw_text": case["raw_text"],
-                    "actual_cleaned": cleaned,
-                })
-                
-                # Report verdict
-                print(f"    Verdict: {verdict}")
+    # Every (chunk, model, prompt) combination is independent, so run them concurrently
+    chunks = [cases[i:i + EVAL_PACK_SIZE] for i in range(0, len(cases), EVAL_PACK_SIZE)]
+    jobs = [(chunk, model, prompt_name) for chunk in chunks for model in cfg["models"] for prompt_name in cfg["prompts"]]
+    
+    if use_batch:
+        prefill_with_batches(jobs, system_prompts)
+    
+    print(f"Running {len(jobs)} jobs with {EVAL_CONCURRENCY} workers")
+    
+    # Prepare results (kept in job order so the CSV is stable between runs)
+    results = [None] * len(jobs)
+    
+    with ThreadPoolExecutor(max_workers=EVAL_CONCURRENCY) as ex:
+        futures = {
+            ex.submit(run_chunk, chunk, model, prompt_name, system_prompts[prompt_name]): i
+            for i, (chunk, model, prompt_name) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            chunk_rows = future.result()
+            results[futures[future]] = chunk_rows
+            
+            # Report verdicts
+            with print_lock:
+                for row in chunk_rows:
+                    print(f"  Case {row['id']} ({row['category']}), model: {row['model']}, prompt: {row['prompt']} -> {row['verdict']}")
+    
+    rows = [row for chunk_rows in results for row in chunk_rows]
     
     # Write results to CSV with timestamp
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
     out_file = f"evals_results_{timestamp}.csv"
-    with open(out_file, "w", newline="") as f:
+    # Large buffer so the file is written in a few big chunks
+    with open(out_file, "w", newline="", buffering=1 << 20) as f:
         # Define field order (put key fields first for readability)
-        fields = [
+        fields = (
             "id", "category", "model", "prompt", "verdict", "explanation",
             "raw_text", "actual_cleaned"
-        ]
-        writer = csv.DictWriter(f, fieldnames=fields)
-        writer.writeheader()
-        writer.writerows(rows)
+        )
+        # Plain csv.writer over tuples avoids DictWriter's per-row field lookups
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(tuple(row[k] for k in fields) for row in rows)
     
     print(f"Results written to {out_file}")
     
-    # Print summary
-    total = len(rows)
-    passed = sum(1 for row in rows if row["verdict"] == "PASS")
+    # Print summary - one pass over rows, every aggregate is derived from the counts
+    counts = Counter((row["model"], row["prompt"], row["verdict"]) for row in rows)
+    total = sum(counts.values())
+    passed = sum(n for (_, _, verdict), n in counts.items() if verdict == "PASS")
     print(f"Summary: {passed}/{total} passed ({passed/total*100:.1f}%)")
     
     # Show passing/failing for each model/prompt combo
     for model in cfg["models"]:
-        model_rows = [row for row in rows if row["model"] == model]
-        model_passed = sum(1 for row in model_rows if row["verdict"] == "PASS")
-        print(f"  {model}: {model_passed}/{len(model_rows)} passed ({model_passed/len(model_rows)*100:.1f}%)")
+        prompt_totals = {
+            prompt_name: (counts[(model, prompt_name, "PASS")], counts[(model, prompt_name, "PASS")] + counts[(model, prompt_name, "FAIL")])
+            for prompt_name in cfg["prompts"]
+        }
+        model_passed = sum(p for p, _ in prompt_totals.values())
+        model_total = sum(t for _, t in prompt_totals.values())
+        print(f"  {model}: {model_passed}/{model_total} passed ({model_passed/model_total*100:.1f}%)")
         
         # Breakdown by prompt for this model
-        for prompt_name in cfg["prompts"]:
-            prompt_rows = [row for row in model_rows if row["prompt"] == prompt_name]
-            prompt_passed = sum(1 for row in prompt_rows if row["verdict"] == "PASS")
-            print(f"    - {prompt_name}: {prompt_passed}/{len(prompt_rows)} passed ({prompt_passed/len(prompt_rows)*100:.1f}%)")
+        for prompt_name, (prompt_passed, prompt_total) in prompt_totals.items():
+            print(f"    - {prompt_name}: {prompt_passed}/{prompt_total} passed ({prompt_passed/prompt_total*100:.1f}%)")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
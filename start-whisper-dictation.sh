@@ -2,4 +2,4 @@
 # Thin wrapper that starts Whisper-based dictation (see whisper_dictation.py)
 
 SCRIPT_DIR="$(dirname "$(readlink -f "$0")")"
-"$SCRIPT_DIR/venv/bin/python3" "$SCRIPT_DIR/whisper_dictation.py" start & 
\ No newline at end of file
+"$SCRIPT_DIR/whisper-dictation-client.sh" start &
@@ -2,4 +2,4 @@
 # Thin wrapper that stops Whisper-based dictation and performs transcription
 
 SCRIPT_DIR="$(dirname "$(readlink -f "$0")")"
-"$SCRIPT_DIR/venv/bin/python3" "$SCRIPT_DIR/whisper_dictation.py" stop 
\ No newline at end of file
+"$SCRIPT_DIR/whisper-dictation-client.sh" stop
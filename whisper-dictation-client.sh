@@ -0,0 +1,17 @@
+#!/usr/bin/env bash
+# Send a command to whisper_dictation_daemon.py if it is running, otherwise run whisper_dictation.py directly
+# Usage: whisper-dictation-client.sh start|stop|toggle [--no-cleanup]
+
+SCRIPT_DIR="$(dirname "$(readlink -f "$0")")"
+SOCK="${WHISPER_SOCKET:-${XDG_RUNTIME_DIR:-/tmp}/whisper_dictation.sock}"
+
+if [ -S "$SOCK" ] && command -v nc >/dev/null 2>&1; then
+    reply="$(echo "$*" | nc -U "$SOCK" 2>/dev/null)"
+    if [ -n "$reply" ]; then
+        echo "$reply"
+        [ "$reply" = "ok" ]
+        exit
+    fi
+fi
+
+exec "$SCRIPT_DIR/venv/bin/python3" "$SCRIPT_DIR/whisper_dictation.py" "$@"
@@ -20,55 +20,212 @@ Environment / config:
     WHISPER_CLEANUP    – "true" to enable LLM cleanup (default: true)
     CLEANUP_MODEL      – model for text cleanup (default: google/gemini-2.5-flash-lite)
                          Options: google/gemini-2.5-flash-lite, google/gemini-2.0-flash-001, gpt-4o-mini
+    CLEANUP_BACKEND    – "api" to clean up through OpenAI/OpenRouter, "local" to run CLEANUP_LOCAL_MODEL
+                         with llama-cpp-python and skip the network round trip (default: api)
+    CLEANUP_LOCAL_MODEL – path to a GGUF instruct model for the local backend
+                         (e.g. qwen2.5-1.5b-instruct-q4_k_m.gguf)
+    CLEANUP_LOCAL_CTX  – context window of the local cleanup model in tokens; it must hold the prompt
+                         and the dictation twice (default: 4096)
     OPENAI_API_KEY     – OpenAI API key (for OpenAI models or API mode transcription)
     OPENROUTER_API_KEY – OpenRouter API key (for Gemini and other OpenRouter models)
     WHISPER_CONTEXT_CONFIG – path to context configuration file (default: ./context_config.yml)
     WHISPER_MODEL_SIZE – local Whisper model size (default: base)
                          Options: base, base.en, small, small.en, medium, medium.en
-    WHISPER_COMPUTE_TYPE – compute type for quantization (default: int8)
-                          Options: int8, float16, float32
+    WHISPER_COMPUTE_TYPE – compute type for quantization (default: int8 on CPU, float16 on CUDA)
+                          Options: int8, int8_float32, int8_float16, int8_bfloat16, float16, float32,
+                          or auto (fastest int8 variant the device supports)
+    WHISPER_CPU_THREADS – CPU threads for local Whisper (default: 0, all cores available to the process)
+    WHISPER_DEVICE     – device for local Whisper: auto, cpu or cuda (default: auto, CUDA when a GPU is
+                         found; falls back to the CPU if the model can't run on CUDA)
+    WHISPER_CT2_DIR    – where convert-whisper-model.sh puts pre-quantized models; a model in
+                         <dir>/<size>-<compute type> is loaded instead of the hub model (default: ~/.cache/whisper-ct2)
+    WHISPER_TRIM_SILENCE – "true" to cut pauses out of the recording with ffmpeg's silenceremove filter,
+                         so Whisper only processes speech; the sequential model then skips its own
+                         VAD pass (default: false)
+    WHISPER_BATCH_SIZE – batch size for faster-whisper's batched pipeline, which decodes VAD chunks
+                         in parallel (default: 8, 0 or 1 uses the sequential model.transcribe)
+    WHISPER_SILENCE_RMS – recordings whose loudest 30 ms frame has an RMS level (16-bit samples) below
+                         this are treated as accidental activations and not transcribed; the wav is
+                         left in the temp directory (default: 100, 0 off)
+    WHISPER_BEAM_SIZE  – beam size for local Whisper (default: 0, greedy decoding for recordings
+                         under 15s and a beam of 5 for longer ones)
+    WHISPER_CHUNK_SECONDS – record in segments of this many seconds and transcribe them in the
+                         background while recording, so stop only waits for the last one (default: 0, off)
+    WHISPER_CACHE_MB   – size cap for the cleanup result cache in LOG_DIR/.cache (default: 10, 0 disables;
+                         always off when WHISPER_LOG_ENABLED=false, since it stores dictated text)
+    WHISPER_SOCKET     – daemon socket path (default: $XDG_RUNTIME_DIR/whisper_dictation.sock)
+    WHISPER_DAEMON_AUTOSTART – "true" to launch whisper_dictation_daemon.py in the background on
+                         `start` when it isn't running, so later dictations use the loaded model (default: false)
+    WHISPER_CLEANUP_OVERLAP_WORDS – local mode: once this many words of complete sentences are decoded,
+                         clean them up while Whisper decodes the rest (default: 0, off)
+    WHISPER_CLEANUP_MIN_WORDS – transcriptions with fewer words are pasted without cleanup (default: 3)
+    WHISPER_CLEANUP_SKIP_CLEAN – "true" to also skip cleanup for short text (under 300 characters)
+                         that already looks well-formed: capitalised sentences ending in punctuation,
+                         no doubled spaces or filler words (default: false)
+    WHISPER_PASTE_MODE – "clipboard" pastes the finished text, "type" types it without touching the
+                         clipboard, "stream" types each sentence as the cleanup model produces it
+                         (default: clipboard)
 
 System dependencies: ffmpeg, xclip, xdotool, notify-send
 Python dependencies: faster-whisper (for local mode), openai, python-dotenv, pyyaml
+Optional: python-xlib (in-process X11 access instead of spawning xdotool), orjson (faster log serialisation),
+          jeepney (notifications over D-Bus instead of spawning notify-send),
+          llama-cpp-python (CLEANUP_BACKEND=local)
 """
 from __future__ import annotations
 
+import atexit
 import os
 import sys
+import shutil
+import signal
 import subprocess
 import datetime
+import functools
+import hashlib
+import importlib.util
+import io
+import queue
+import select
+import socket
+import threading
 import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Optional, Dict, List, Any
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Callable, Optional, Dict, List, Any, Pattern, Tuple, Union
 import re
 import json
 
+ENV_FILE = Path(__file__).resolve().parent / ".env"
+# Parsed copy of ENV_FILE, reused while the file's mtime is unchanged (holds API keys: mode 0600)
+ENV_CACHE = Path.home() / ".cache" / "whisper_dictation" / "env.json"
+
+
+def _load_env() -> None:
+    """Load .env into os.environ without overriding variables that are already set.
+
+    Parsing goes through python-dotenv only when .env changed since the cached snapshot.
+    """
+    try:
+        mtime = ENV_FILE.stat().st_mtime
+    except OSError:
+        # No .env beside the script: let python-dotenv search parent directories as before
+        from dotenv import load_dotenv
+        load_dotenv()
+        return
+
+    values = None
+    try:
+        cached = json.loads(ENV_CACHE.read_bytes())
+        if cached.get("source") == str(ENV_FILE) and cached.get("mtime") == mtime:
+            values = cached["values"]
+            # A corrupted or hand-edited snapshot is re-parsed rather than trusted
+            if not (isinstance(values, dict)
+                    and all(isinstance(k, str) and isinstance(v, str) for k, v in values.items())):
+                values = None
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+
+    if values is None:
+        from dotenv import dotenv_values
+        values = {k: v for k, v in dotenv_values(ENV_FILE).items() if v is not None}
+        try:
+            ENV_CACHE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = ENV_CACHE.with_suffix(f".{os.getpid()}.tmp")
+            fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"source": str(ENV_FILE), "mtime": mtime, "values": values}, f)
+            os.replace(tmp, ENV_CACHE)
+        except OSError:
+            pass  # the cache is only an optimisation
+
+    for key, value in values.items():
+        os.environ.setdefault(key, value)
+
+
 # Load .env FIRST, before defining any constants that use os.getenv()
-load_dotenv()
+_load_env()
+
+if TYPE_CHECKING:
+    import numpy as np
+    from faster_whisper import WhisperModel
+
+# openai, faster_whisper and yaml are imported where they are used: they are slow to
+# import and commands like `start` never need them.
 
 try:
-    from openai import OpenAI
-except ImportError:  # graceful message
-    OpenAI = None  # type: ignore
+    import orjson
+except ImportError:  # optional: falls back to json
+    orjson = None  # type: ignore
 
 try:
-    from faster_whisper import WhisperModel
-except ImportError:  # graceful message
-    WhisperModel = None  # type: ignore
+    from Xlib import X, XK, display as xdisplay
+    from Xlib.ext import xtest
+except ImportError:  # optional: falls back to xdotool
+    xdisplay = None  # type: ignore
 
 try:
-    import yaml
-except ImportError:  # graceful message
-    yaml = None  # type: ignore
+    from jeepney import DBusAddress, new_method_call
+    from jeepney.io.blocking import open_dbus_connection
+    from jeepney.low_level import MessageFlag
+except ImportError:  # optional: falls back to notify-send
+    open_dbus_connection = None  # type: ignore
 
+# Recorder state: {"pid": ..., "wav": ..., "start_ts": ...} plus "segments_dir" in chunked mode
 PID_FILE = Path.home() / ".whisper_recorder_pid"
 TMP_DIR = Path(os.getenv("WHISPER_TEMP_DIR", "/tmp/whisper_records"))
 WHISPER_MODE = os.getenv("WHISPER_MODE", "local").lower()  # "local" or "api"
 CLEANUP_ENABLED = os.getenv("WHISPER_CLEANUP", "true").lower() in {"1", "true", "yes"}
 CLEANUP_MODEL = os.getenv("CLEANUP_MODEL", "google/gemini-2.5-flash-lite")  # Model for text cleanup
+CLEANUP_BACKEND = os.getenv("CLEANUP_BACKEND", "api").lower()  # "api" or "local" (llama.cpp)
+CLEANUP_LOCAL_MODEL = os.path.expanduser(os.getenv("CLEANUP_LOCAL_MODEL", ""))  # GGUF file for "local"
+CLEANUP_LOCAL_CTX = int(os.getenv("CLEANUP_LOCAL_CTX", "4096"))  # context window in tokens
+CLEANUP_MIN_WORDS = int(os.getenv("WHISPER_CLEANUP_MIN_WORDS", "3"))
+CLEANUP_OVERLAP_WORDS = int(os.getenv("WHISPER_CLEANUP_OVERLAP_WORDS", "0"))
+CLEANUP_SKIP_CLEAN = os.getenv("WHISPER_CLEANUP_SKIP_CLEAN", "false").lower() in {"1", "true", "yes"}
+# Short text of sentences that each start with a capital and end with terminal punctuation,
+# without the fillers cleanup exists to remove
+_ALREADY_CLEAN_RE = re.compile(r"[A-Z][^.!?]*[.!?](?: [A-Z][^.!?]*[.!?])*")
+_FILLER_RE = re.compile(r"\b(?:u+m+|u+h+|erm|hmm+)\b", re.IGNORECASE)
+ALREADY_CLEAN_MAX_CHARS = 300
 WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")  # small has better accuracy than base
-WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "")  # empty: per-device default
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "auto").lower()
+WHISPER_CPU_THREADS = int(os.getenv("WHISPER_CPU_THREADS", "0"))
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "0"))  # 0: greedy for short clips, 5 otherwise
+SHORT_AUDIO_SECONDS = 15.0
+SILENCE_RMS = float(os.getenv("WHISPER_SILENCE_RMS", "100"))  # 16-bit sample RMS; 0 disables the gate
+TRIM_SILENCE = os.getenv("WHISPER_TRIM_SILENCE", "false").lower() in {"1", "true", "yes"}
+# Drop leading silence and shorten every pause to 0.5s (threshold -40dB)
+SILENCE_FILTER = (
+    "silenceremove=start_periods=1:start_silence=0.3:start_threshold=-40dB:"
+    "stop_periods=-1:stop_silence=0.5:stop_threshold=-40dB"
+)
+CT2_MODEL_DIR = Path(os.getenv("WHISPER_CT2_DIR", str(Path.home() / ".cache" / "whisper-ct2")))
+# Record in N-second segments and transcribe them while still recording (0 = single file)
+CHUNK_SECONDS = int(os.getenv("WHISPER_CHUNK_SECONDS", "0"))
+SEGMENT_POLL_SECONDS = 0.25
+# Longest record_stop waits for the segment transcriber before finishing the work itself
+SEGMENT_WAIT_TIMEOUT = 120
+# How long to wait for ffmpeg to finalise the file after SIGINT
+RECORDER_EXIT_TIMEOUT = 1.0
+# Set by whisper_dictation_daemon.py: start and stop run in the same process there, so the
+# audio can be piped from ffmpeg into memory instead of going through a wav file
+IN_MEMORY_RECORDING = False
+SAMPLE_RATE = 16000
+# Active in-memory recording: (ffmpeg process, reader thread, captured PCM chunks)
+_memory_recording: Optional[Tuple[subprocess.Popen, threading.Thread, List[bytes]]] = None
+
+# Leftover recordings older than this are removed when a new recording starts
+STALE_RECORDING_SECONDS = 3600
+
+PASTE_MODE = os.getenv("WHISPER_PASTE_MODE", "clipboard").lower()  # "clipboard", "type" or "stream"
+# In stream mode, a sentence longer than this is typed up to its last complete word
+STREAM_FLUSH_CHARS = 80
+# End of a sentence: terminal punctuation (plus closing quotes/brackets) before whitespace, or a newline
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]*(?=\s)|\n")
 
 # Config file path
 DEFAULT_CONFIG = Path(__file__).resolve().parent / "context_config.yml"
@@ -80,11 +237,95 @@ LOG_ENABLED = os.getenv("WHISPER_LOG_ENABLED", "true").lower() in {"1", "true",
 _default_log_dir = Path(__file__).resolve().parent / ".whisper"
 LOG_DIR = Path(os.getenv("WHISPER_LOG_DIR", str(_default_log_dir)))
 
+# Content-addressed cache of cleanup results, trimmed least-recently-used first. It holds dictated
+# text, so like the log it is only kept when logging is enabled
+CACHE_DIR = LOG_DIR / ".cache"
+CACHE_MAX_BYTES = int(float(os.getenv("WHISPER_CACHE_MB", "10")) * 1024 * 1024) if LOG_ENABLED else 0
+
+# Short-lived helpers (xdotool, xclip, xprop, notify-send) share one /dev/null fd. Python opens its
+# own fds non-inheritable (PEP 446), so close_fds=False is safe and saves closing them per spawn
+_DEVNULL_FD = os.open(os.devnull, os.O_RDWR | os.O_CLOEXEC)
+_QUIET = {"stdin": _DEVNULL_FD, "stdout": _DEVNULL_FD, "close_fds": False}
+
 REQUIRED_CMDS = ["ffmpeg", "xclip", "xdotool", "notify-send"]
 
+COMMANDS = {"start", "stop", "toggle"}
+
+# Unix socket used by whisper_dictation_daemon.py (see whisper-dictation-client.sh)
+SOCKET_PATH = Path(os.getenv(
+    "WHISPER_SOCKET",
+    os.path.join(os.getenv("XDG_RUNTIME_DIR", "/tmp"), "whisper_dictation.sock"),
+))
+DAEMON_SCRIPT = Path(__file__).resolve().parent / "whisper_dictation_daemon.py"
+DAEMON_AUTOSTART = os.getenv("WHISPER_DAEMON_AUTOSTART", "false").lower() in {"1", "true", "yes"}
+# Set by whisper_dictation_daemon.py so it never sends transcription requests to itself
+IN_DAEMON = False
+
+
+def _has_module(name: str) -> bool:
+    """Check whether a package is installed without importing it."""
+    return importlib.util.find_spec(name) is not None
+
+
+# Idle pooled connections are kept this long; prewarm_cleanup_client skips its request while the
+# cleanup connection was used more recently than this
+CLEANUP_KEEPALIVE_SECONDS = 30.0
+_cleanup_last_used = 0.0
+
+
+# API clients are cached per endpoint so transcription and cleanup reuse warm connections
+@functools.lru_cache(maxsize=None)
+def _get_api_client(base_url: Optional[str], api_key: str):
+    """Return a cached OpenAI-compatible client with its own keep-alive pool."""
+    import httpx
+    from openai import OpenAI
+
+    http_client = httpx.Client(
+        # HTTP/2 needs the optional h2 package (pip install httpx[http2])
+        http2=_has_module("h2"),
+        # Fail fast on a dead connection instead of the SDK's 10 minute default; sized for
+        # cleanup requests, transcribe_api extends it for uploads
+        timeout=httpx.Timeout(30.0, connect=3.0),
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=CLEANUP_KEEPALIVE_SECONDS),
+    )
+    return OpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+
+
+def _get_openai_client():
+    """Return the shared OpenAI client, creating it on first use."""
+    return _get_api_client(None, os.getenv("OPENAI_API_KEY"))
+
+
+@functools.lru_cache(maxsize=1)
+def load_cleanup_llm():
+    """Load the local cleanup model (CLEANUP_BACKEND=local) once per process."""
+    from llama_cpp import Llama
+
+    print(f"Loading cleanup model ({CLEANUP_LOCAL_MODEL})...")
+    start = time.time()
+    llm = Llama(model_path=CLEANUP_LOCAL_MODEL, n_ctx=CLEANUP_LOCAL_CTX, n_threads=len(os.sched_getaffinity(0)),
+                verbose=False)
+    print(f"Cleanup model loaded in {time.time() - start:.2f}s")
+    return llm
+
+
+def cleanup_model_name() -> str:
+    """The model cleanup runs on, for the result cache key and the dictation log."""
+    return CLEANUP_LOCAL_MODEL if CLEANUP_BACKEND == "local" else CLEANUP_MODEL
+
 
 def get_cleanup_client():
-    """Get appropriate API client based on cleanup model."""
+    """Get appropriate API client based on cleanup model (the llama.cpp model for the local backend)."""
+    if CLEANUP_BACKEND == "local":
+        if not CLEANUP_LOCAL_MODEL:
+            return None, "CLEANUP_LOCAL_MODEL"
+        try:
+            return load_cleanup_llm(), None
+        except Exception as e:
+            # Like a missing API key: paste the raw transcription rather than failing the dictation
+            print(f"Could not load cleanup model {CLEANUP_LOCAL_MODEL}: {str(e)}")
+            return None, "CLEANUP_LOCAL_MODEL"
+
     model = CLEANUP_MODEL
 
     # Determine if we need OpenRouter or OpenAI
@@ -93,16 +334,37 @@ def get_cleanup_client():
         api_key = os.getenv("OPENROUTER_API_KEY")
         if not api_key:
             return None, "OPENROUTER_API_KEY"
-        return OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key
-        ), None
+        return _get_api_client("https://openrouter.ai/api/v1", api_key), None
     else:
         # OpenAI model (no prefix)
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             return None, "OPENAI_API_KEY"
-        return OpenAI(api_key=api_key), None
+        return _get_openai_client(), None
+
+
+def prewarm_cleanup_client() -> tuple:
+    """Build the cleanup client and open its HTTPS connection ahead of the first request.
+
+    Run in the background while Whisper is transcribing, so the import, client set-up and
+    TCP+TLS handshake are off the critical path (for the local backend, the model load).
+    Skipped when the pooled connection was used recently enough to still be open, as it
+    usually is between dictations in the daemon. Returns get_cleanup_client()'s result.
+    """
+    global _cleanup_last_used
+    client, missing_key = get_cleanup_client()
+    if (client is not None and CLEANUP_BACKEND != "local"
+            and time.time() - _cleanup_last_used > CLEANUP_KEEPALIVE_SECONDS):
+        try:
+            import httpx
+
+            # Small authenticated request each provider serves; any response leaves a warm connection
+            path = "/key" if "/" in CLEANUP_MODEL else f"/models/{CLEANUP_MODEL}"
+            client.with_options(timeout=3.0, max_retries=0).get(path, cast_to=httpx.Response)
+            _cleanup_last_used = time.time()
+        except Exception:
+            pass
+    return client, missing_key
 
 
 SYSTEM_PROMPT_CLEANUP = (
@@ -157,57 +419,198 @@ SYSTEM_PROMPT_CLEANUP = (
     
     "Use Australian English spelling."
 )
+# Static first message of every cleanup request; window-specific context follows it
+_BASE_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT_CLEANUP}
+
+
+# PATH value for which every required command was last found
+_commands_found_on_path: Optional[str] = None
+
+
+def _missing_commands() -> Tuple[str, ...]:
+    """Return required system commands not found on PATH.
+
+    A successful check is remembered until PATH changes; a failed one is retried next time so
+    a long-lived daemon notices newly installed tools.
+    """
+    global _commands_found_on_path
+    path = os.environ.get("PATH")
+    if path is not None and path == _commands_found_on_path:
+        return ()
+    # shutil.which walks PATH in-process instead of forking `which` per command
+    missing = tuple(cmd for cmd in REQUIRED_CMDS if shutil.which(cmd, path=path) is None)
+    if not missing:
+        _commands_found_on_path = path
+    return missing
 
 
 def check_dependencies(cleanup_enabled: bool) -> bool:
-    missing = []
-    for cmd in REQUIRED_CMDS:
-        if subprocess.call(["which", cmd], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
-            missing.append(cmd)
+    missing = _missing_commands()
     if missing:
         print(f"Missing required system commands: {', '.join(missing)}", file=sys.stderr)
         return False
 
     # Check mode-specific dependencies
     if WHISPER_MODE == "local":
-        if WhisperModel is None:
+        if not _has_module("faster_whisper"):
             print("Missing python package 'faster-whisper' (required for local mode).", file=sys.stderr)
             print("  pip install faster-whisper", file=sys.stderr)
             print("  Or set WHISPER_MODE=api to use OpenAI Whisper API", file=sys.stderr)
             return False
     elif WHISPER_MODE == "api":
-        if OpenAI is None:
+        if not _has_module("openai"):
             print("Missing python package 'openai' (required for API mode).", file=sys.stderr)
             print("  pip install openai", file=sys.stderr)
             return False
 
-    if cleanup_enabled and OpenAI is None:
+    if cleanup_enabled and CLEANUP_BACKEND == "local":
+        if not _has_module("llama_cpp"):
+            print("Missing python package 'llama-cpp-python' (required for CLEANUP_BACKEND=local).",
+                  file=sys.stderr)
+            print("  pip install llama-cpp-python", file=sys.stderr)
+            return False
+    elif cleanup_enabled and not _has_module("openai"):
         print("Missing python package 'openai' (required for cleanup).", file=sys.stderr)
         print("  pip install openai", file=sys.stderr)
         return False
 
-    if yaml is None:
+    if not _has_module("yaml"):
         print("Missing python package 'pyyaml'. Please install it.", file=sys.stderr)
         return False
 
     return True
 
 
+@functools.lru_cache(maxsize=1)
+def _get_dbus():
+    """Open (once) a session bus connection via jeepney, or None if unavailable."""
+    if open_dbus_connection is None:
+        return None
+    try:
+        return open_dbus_connection(bus="SESSION")
+    except Exception as e:
+        print(f"Failed to connect to D-Bus: {str(e)}")
+        return None
+
+
+def _notify_dbus(title: str, message: str, timeout_ms: int) -> bool:
+    """Send a desktop notification over D-Bus. Returns False if it couldn't be sent."""
+    conn = _get_dbus()
+    if conn is None:
+        return False
+    msg = new_method_call(
+        DBusAddress("/org/freedesktop/Notifications",
+                    bus_name="org.freedesktop.Notifications",
+                    interface="org.freedesktop.Notifications"),
+        "Notify", "susssasa{sv}i",
+        ("whisper-dictation", 0, "", title, message, [], {}, timeout_ms),
+    )
+    # No need for the notification id, so ask for no reply rather than leaving one unread on the
+    # cached connection
+    msg.header.flags |= MessageFlag.no_reply_expected
+    try:
+        conn.send(msg)
+    except OSError:
+        return False
+    return True
+
+
 def notify(title: str, message: str, timeout_ms: int = 3000) -> None:
     try:
-        subprocess.run(["notify-send", "-t", str(timeout_ms), title, message], check=False)
+        if not _notify_dbus(title, message, timeout_ms):
+            subprocess.run(["notify-send", "-t", str(timeout_ms), title, message], check=False, **_QUIET)
     except Exception:
         pass  # ignore failures silently
 
 
+@functools.lru_cache(maxsize=1)
+def _get_display():
+    """Open (once) a connection to the X server via python-xlib, or None if unavailable."""
+    if xdisplay is None:
+        return None
+    try:
+        return xdisplay.Display()
+    except Exception as e:
+        print(f"Failed to open X display: {str(e)}")
+        return None
+
+
+def _reset_display() -> None:
+    """Drop the cached X connection (and its atoms) after an error, e.g. the X server restarted,
+    so the next call reconnects."""
+    d = _get_display()
+    _get_display.cache_clear()
+    _atom.cache_clear()
+    if d is not None:
+        try:
+            d.close()
+        except Exception:
+            pass
+
+
+@functools.lru_cache(maxsize=None)
+def _atom(name: str) -> int:
+    """Intern an X atom once per process."""
+    return _get_display().intern_atom(name)
+
+
+def _active_window_xlib() -> Optional[Tuple[int, Optional[str], Optional[str]]]:
+    """Return (window id, name, WM_CLASS) of the active window via the open X connection.
+
+    WM_CLASS is formatted like xprop's output with the quotes removed: "instance, class".
+
+    Returns None if python-xlib is unavailable or the window manager doesn't expose
+    _NET_ACTIVE_WINDOW, so the caller can fall back to xdotool.
+    """
+    d = _get_display()
+    if d is None:
+        return None
+    try:
+        prop = d.screen().root.get_full_property(_atom("_NET_ACTIVE_WINDOW"), X.AnyPropertyType)
+        if not prop or not len(prop.value) or not prop.value[0]:
+            return None
+        win_id = int(prop.value[0])
+        win = d.create_resource_object("window", win_id)
+        name_prop = win.get_full_property(_atom("_NET_WM_NAME"), _atom("UTF8_STRING"))
+        if name_prop:
+            name = name_prop.value
+            if isinstance(name, bytes):
+                name = name.decode("utf-8", "replace")
+        else:
+            name = win.get_wm_name()
+        wm_class = win.get_wm_class()
+        return win_id, name, ", ".join(wm_class) if wm_class else None
+    except Exception as e:
+        print(f"Failed to get window info via Xlib: {str(e)}")
+        _reset_display()
+        return None
+
+
 def get_active_window_info() -> Dict[str, Optional[str]]:
     """Get info about the currently active window (name and WM_CLASS)."""
     result = {"name": None, "wm_class": None}
     try:
-        win_id = subprocess.check_output(["xdotool", "getactivewindow"], text=True).strip()
-        result["name"] = subprocess.check_output(["xdotool", "getwindowname", win_id], text=True).strip()
-        # Get WM_CLASS via xprop
-        xprop_output = subprocess.check_output(["xprop", "-id", win_id, "WM_CLASS"], text=True).strip()
+        active = _active_window_xlib()
+        if active:
+            win_id = str(active[0])
+            result["name"] = active[1].strip() if active[1] else active[1]
+            result["wm_class"] = active[2]
+            if active[2] is not None:
+                return result
+        else:
+            # One chained xdotool process: getwindowname prints the name, and the trailing
+            # getactivewindow (as the last command in the chain) prints the window id
+            output = subprocess.check_output(
+                ["xdotool", "getactivewindow", "getwindowname", "getactivewindow"], text=True,
+                stdin=_DEVNULL_FD, close_fds=False,
+            )
+            name, win_id = output.rstrip("\n").rsplit("\n", 1)
+            result["name"] = name.strip()
+            win_id = win_id.strip()
+        # Get WM_CLASS via xprop (without python-xlib, or if Xlib couldn't read it)
+        xprop_output = subprocess.check_output(
+            ["xprop", "-id", win_id, "WM_CLASS"], text=True, stdin=_DEVNULL_FD, close_fds=False
+        ).strip()
         # Format: WM_CLASS(STRING) = "instance", "class"
         if "=" in xprop_output:
             class_part = xprop_output.split("=", 1)[1].strip()
@@ -226,55 +629,195 @@ def get_active_window_name() -> Optional[str]:
     return get_active_window_info()["name"]
 
 
-def load_context_config() -> List[Dict[str, Any]]:
-    """Load context rules from the config file, or return empty list if unavailable."""
+_REGEX_METACHARS = set(".^$*+?{}[]\\|()")
+
+
+class _LiteralPattern:
+    """Stand-in for a compiled window_pattern that is really a plain string.
+
+    Handles patterns like ".*Cursor.*", "^Terminal$" or ".*Slack$" with str methods
+    instead of running the regex engine; exposes the same .pattern/.search() as re.Pattern.
+    """
+
+    __slots__ = ("pattern", "text", "anchor_start", "anchor_end")
+
+    def __init__(self, pattern: str, text: str, anchor_start: bool, anchor_end: bool) -> None:
+        self.pattern = pattern
+        self.text = text
+        self.anchor_start = anchor_start
+        self.anchor_end = anchor_end
+
+    def search(self, value: str) -> bool:
+        if self.anchor_start and self.anchor_end:
+            return value == self.text
+        if self.anchor_start:
+            return value.startswith(self.text)
+        if self.anchor_end:
+            return value.endswith(self.text)
+        return self.text in value
+
+    @classmethod
+    def compile(cls, pattern: str) -> Optional["_LiteralPattern"]:
+        """Return a literal matcher for pattern, or None if it needs the regex engine."""
+        core = pattern
+        anchor_start = core.startswith("^")
+        if anchor_start:
+            core = core[1:]
+        elif core.startswith(".*"):
+            core = core[2:]
+        anchor_end = core.endswith("$")
+        if anchor_end:
+            core = core[:-1]
+        elif core.endswith(".*"):
+            core = core[:-2]
+        if _REGEX_METACHARS.intersection(core):
+            return None
+        return cls(pattern, core, anchor_start, anchor_end)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_config_cached(path: str, mtime: float) -> tuple:
+    """Parse the config file, compile its window patterns and build each rule's system messages.
+
+    Cached per (path, mtime): repeat calls in a long-running process cost one stat(),
+    and editing the file invalidates the entry. Returns (rules, compiled rules).
+    """
+    import yaml
+
+    # libyaml's C loader is several times faster than the pure-Python one
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     try:
-        if CONFIG_PATH.exists():
-            with CONFIG_PATH.open("r") as f:
-                config = yaml.safe_load(f)
-                return config.get("context_rules", [])
-        else:
-            print(f"Context config file not found: {CONFIG_PATH}")
+        with open(path, "rb") as f:
+            config = yaml.load(f, Loader=loader) or {}
+        rules = tuple(config.get("context_rules") or [])
     except Exception as e:
         print(f"Error loading context config: {str(e)}")
-    
-    return []
+        return (), ()
+
+    compiled = []
+    for rule in rules:
+        pattern = rule.get("window_pattern")
+        if not pattern:
+            continue
+        if rule.get("extra_context"):
+            rule["_system_messages"] = (
+                _BASE_SYSTEM_MESSAGE, {"role": "system", "content": rule["extra_context"]})
+        try:
+            compiled.append((_LiteralPattern.compile(pattern) or re.compile(pattern), rule))
+        except re.error as e:
+            print(f"Invalid window_pattern '{pattern}': {str(e)}")
+    return rules, tuple(compiled)
+
+
+def _config_version() -> Optional[Tuple[str, float]]:
+    """Return (path, mtime) identifying the current config file, or None if it can't be read."""
+    try:
+        return str(CONFIG_PATH), CONFIG_PATH.stat().st_mtime
+    except FileNotFoundError:
+        print(f"Context config file not found: {CONFIG_PATH}")
+    except OSError as e:
+        print(f"Error loading context config: {str(e)}")
+    return None
+
+
+def _context_config() -> tuple:
+    """Return the cached (rules, compiled rules) for the current version of the config file."""
+    version = _config_version()
+    if version is None:
+        return (), ()
+    return _load_config_cached(*version)
+
+
+def load_context_config() -> Tuple[Dict[str, Any], ...]:
+    """Load context rules from the config file, or return an empty tuple if unavailable."""
+    return _context_config()[0]
+
 
+def compiled_context_rules() -> Tuple[Tuple[Union[Pattern[str], _LiteralPattern], Dict[str, Any]], ...]:
+    """Return (compiled window_pattern, rule) pairs for all rules that have a pattern.
 
-def _window_matches_pattern(pattern: str, window_info: Dict[str, Optional[str]]) -> bool:
-    """Check if window info matches a pattern (against name or WM_CLASS)."""
+    Plain-string patterns are compiled to a _LiteralPattern instead of a regex.
+    """
+    return _context_config()[1]
+
+
+def _window_matches_pattern(pattern: Union[Pattern[str], _LiteralPattern], window_info: Dict[str, Optional[str]]) -> bool:
+    """Check if window info matches a compiled pattern (against name or WM_CLASS)."""
     window_name = window_info.get("name")
     wm_class = window_info.get("wm_class")
 
-    if window_name and re.search(pattern, window_name):
+    if window_name and pattern.search(window_name):
         return True
-    if wm_class and re.search(pattern, wm_class):
+    if wm_class and pattern.search(wm_class):
         return True
     return False
 
 
-def get_context_for_window(window_info: Dict[str, Optional[str]]) -> Optional[str]:
+@functools.lru_cache(maxsize=128)
+def _match_window(name: Optional[str], wm_class: Optional[str],
+                  version: Tuple[str, float]) -> Tuple[Optional[int], Optional[int]]:
+    """Return rule indices for a window: (first match, first match with a paste_key).
+
+    Memoized per window and config version, so repeat dictations into the same window
+    skip pattern matching, and editing the config starts afresh.
     """
-    Determine if extra context should be provided based on window info.
-    Matches pattern against both window name and WM_CLASS.
-    Returns the extra context to add or None if no rules match.
+    window_info = {"name": name, "wm_class": wm_class}
+    matches = (
+        (index, rule)
+        for index, (pattern, rule) in enumerate(_load_config_cached(*version)[1])
+        if _window_matches_pattern(pattern, window_info)
+    )
+    context_index = None
+    for index, rule in matches:
+        if context_index is None:
+            context_index = index
+        if rule.get("paste_key"):
+            return context_index, index
+    return context_index, None
+
+
+def _window_rule(window_info: Dict[str, Optional[str]], for_paste_key: bool = False
+                 ) -> Optional[Tuple[int, Any, Dict[str, Any]]]:
+    """Return (index, pattern, rule) for the window's matching rule, or None.
+
+    With for_paste_key, the first matching rule that sets a paste_key.
     """
     if not window_info.get("name") and not window_info.get("wm_class"):
         return None
+    version = _config_version()
+    if version is None:
+        return None
+    indices = _match_window(window_info.get("name"), window_info.get("wm_class"), version)
+    index = indices[1] if for_paste_key else indices[0]
+    if index is None:
+        return None
+    pattern, rule = _load_config_cached(*version)[1][index]
+    return index, pattern, rule
 
-    context_rules = load_context_config()
 
-    for rule in context_rules:
-        pattern = rule.get("window_pattern")
-        if pattern and _window_matches_pattern(pattern, window_info):
-            window_name = window_info.get("name", "unknown")
-            wm_class = window_info.get("wm_class", "")
-            print(f"Window '{window_name}' (class: {wm_class}) matches pattern '{pattern}'")
-            if "description" in rule:
-                print(f"Applying rule: {rule['description']}")
-            return rule.get("extra_context")
+def _match_context_rule(window_info: Dict[str, Optional[str]]) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """Return (index, rule) for the first rule matching the window, or None."""
+    match = _window_rule(window_info)
+    if match is None:
+        return None
 
-    return None
+    index, pattern, rule = match
+    window_name = window_info.get("name", "unknown")
+    wm_class = window_info.get("wm_class", "")
+    print(f"Window '{window_name}' (class: {wm_class}) matches pattern '{pattern.pattern}'")
+    if "description" in rule:
+        print(f"Applying rule: {rule['description']}")
+    return index, rule
+
+
+def get_context_for_window(window_info: Dict[str, Optional[str]]) -> Optional[str]:
+    """
+    Determine if extra context should be provided based on window info.
+    Matches pattern against both window name and WM_CLASS.
+    Returns the extra context to add or None if no rules match.
+    """
+    match = _match_context_rule(window_info)
+    return match[1].get("extra_context") if match else None
 
 
 def get_paste_key_for_window(window_info: Dict[str, Optional[str]]) -> str:
@@ -283,29 +826,137 @@ def get_paste_key_for_window(window_info: Dict[str, Optional[str]]) -> str:
     Matches pattern against both window name and WM_CLASS.
     Returns the paste key (default: "ctrl+v").
     """
-    if not window_info.get("name") and not window_info.get("wm_class"):
+    match = _window_rule(window_info, for_paste_key=True)
+    if match is None:
         return "ctrl+v"
+    paste_key = match[2]["paste_key"]
+    window_name = window_info.get("name", "unknown")
+    print(f"Using paste key '{paste_key}' for window '{window_name}'")
+    return paste_key
 
-    context_rules = load_context_config()
 
-    for rule in context_rules:
-        pattern = rule.get("window_pattern")
-        if pattern and _window_matches_pattern(pattern, window_info):
-            paste_key = rule.get("paste_key")
-            if paste_key:
-                window_name = window_info.get("name", "unknown")
-                print(f"Using paste key '{paste_key}' for window '{window_name}'")
-                return paste_key
+def _pid_alive(pid: int) -> bool:
+    """Return True if the process is still running."""
+    try:
+        # Reap it first if it is our own exited child (e.g. started by the daemon)
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return False
+    except ChildProcessError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _wait_for_exit(pid: int, timeout: float) -> None:
+    """Wait up to timeout seconds for a process to exit.
+
+    Uses a pidfd where available so the kernel wakes us on exit; otherwise polls.
+    """
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return
+    except (AttributeError, OSError):
+        deadline = time.time() + timeout
+        while _pid_alive(pid) and time.time() < deadline:
+            time.sleep(0.01)
+        return
+
+    try:
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        poller.poll(timeout * 1000)
+    finally:
+        os.close(fd)
+    _pid_alive(pid)  # reaps it if it was our own child
+
+
+def remove_stale_recordings() -> None:
+    """Delete recordings left behind by crashed runs so TMP_DIR stays small."""
+    cutoff = time.time() - STALE_RECORDING_SECONDS
+    try:
+        with os.scandir(TMP_DIR) as it:
+            for entry in it:
+                if not entry.name.startswith("dictation_"):
+                    continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                    else:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
+    except FileNotFoundError:
+        pass
+
+
+def _read_pcm(pipe, chunks: List[bytes]) -> None:
+    """Collect raw PCM from ffmpeg's stdout until it exits."""
+    with pipe:
+        for chunk in iter(lambda: pipe.read(65536), b""):
+            chunks.append(chunk)
+
+
+def _finish_memory_recording() -> Optional[Union[io.BytesIO, np.ndarray]]:
+    """Return the captured PCM ready for transcription.
+
+    Local mode gets float32 samples, which faster-whisper takes as-is (no decoding or
+    resampling); API mode gets an in-memory wav file to upload.
+    """
+    global _memory_recording
+    if _memory_recording is None:
+        print("No in-memory recording in this process (daemon restarted?).", file=sys.stderr)
+        return None
+    proc, reader, chunks = _memory_recording
+    _memory_recording = None
+    reader.join(timeout=RECORDER_EXIT_TIMEOUT)
+
+    if WHISPER_MODE == "local":
+        import numpy as np
+
+        return np.frombuffer(b"".join(chunks), dtype=np.int16).astype(np.float32) / 32768.0
 
-    return "ctrl+v"
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(b"".join(chunks))
+    buf.seek(0)
+    buf.name = "audio.wav"  # the OpenAI client uses the name to detect the format
+    return buf
+
+
+def ensure_daemon() -> None:
+    """Launch whisper_dictation_daemon.py in the background if its socket isn't there yet."""
+    if IN_DAEMON or SOCKET_PATH.exists() or not DAEMON_SCRIPT.exists():
+        return
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    with open(LOG_DIR / "daemon.log", "ab") as log:
+        subprocess.Popen([sys.executable, str(DAEMON_SCRIPT)], stdin=_DEVNULL_FD, stdout=log,
+                         stderr=subprocess.STDOUT, start_new_session=True)
+    print("Started whisper_dictation_daemon.py in the background")
 
 
 def record_start() -> None:
+    global _memory_recording
     if PID_FILE.exists():
         print("Recording seems to be already running (PID file exists).", file=sys.stderr)
         return
 
+    if DAEMON_AUTOSTART and WHISPER_MODE == "local":
+        # Loads the model while we record; it serves the next dictations
+        ensure_daemon()
+
     TMP_DIR.mkdir(parents=True, exist_ok=True)
+    remove_stale_recordings()
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     wav_path = TMP_DIR / f"dictation_{timestamp}.wav"
 
@@ -315,82 +966,384 @@ def record_start() -> None:
         "-f", "alsa",
         "-i", "default",
         "-ac", "1",
-        "-ar", "16000",
+        "-ar", str(SAMPLE_RATE),
         "-v", "quiet",
         "-y",
-        str(wav_path),
     ]
-
-    proc = subprocess.Popen(cmd)
-    PID_FILE.write_text(str(proc.pid))
+    if TRIM_SILENCE:
+        cmd += ["-af", SILENCE_FILTER]
+
+    segments_dir = None
+    if CHUNK_SECONDS > 0:
+        # Rolling segments: each file is closed (and can be transcribed) when the next starts
+        segments_dir = TMP_DIR / f"dictation_{timestamp}"
+        segments_dir.mkdir(exist_ok=True)
+        wav_path = segments_dir / "segment_%04d.wav"
+        cmd += ["-f", "segment", "-segment_time", str(CHUNK_SECONDS), "-reset_timestamps", "1"]
+
+    if IN_MEMORY_RECORDING and segments_dir is None:
+        cmd += ["-f", "s16le", "pipe:1"]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        chunks: List[bytes] = []
+        reader = threading.Thread(target=_read_pcm, args=(proc.stdout, chunks), daemon=True)
+        reader.start()
+        _memory_recording = (proc, reader, chunks)
+        state = {"pid": proc.pid, "memory": True, "start_ts": time.time()}
+        wav_path = "memory"
+    else:
+        cmd.append(str(wav_path))
+        proc = subprocess.Popen(cmd)
+        state = {"pid": proc.pid, "wav": str(wav_path), "start_ts": time.time()}
+
+    if WHISPER_MODE == "local" and not IN_DAEMON and not SOCKET_PATH.exists():
+        # No daemon holds the model, so stop will load it: pull its files into the page cache
+        # while the user is speaking
+        subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "_warm-model"],
+                         stderr=_DEVNULL_FD, start_new_session=True, **_QUIET)
+
+    if segments_dir is not None:
+        watcher = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve()), "_transcribe-segments", str(segments_dir)],
+            start_new_session=True,
+        )
+        (segments_dir / "watcher.pid").write_text(str(watcher.pid))
+        state["segments_dir"] = str(segments_dir)
+    PID_FILE.write_text(json.dumps(state))
 
     notify("Whisper Dictation", "Recording started…")
     print(f"Recording to {wav_path} (PID {proc.pid})")
 
 
-def kill_recorder() -> Optional[Path]:
+def kill_recorder() -> Optional[Union[Path, io.BytesIO, np.ndarray]]:
+    """Stop ffmpeg and return the recording: a wav file, the segments directory in chunked mode,
+    or in-memory audio when recording in-process (see _finish_memory_recording)."""
     if not PID_FILE.exists():
         print("No active recorder PID file found.", file=sys.stderr)
         return None
 
     try:
-        pid = int(PID_FILE.read_text().strip())
-    except ValueError:
+        state = json.loads(PID_FILE.read_text())
+        if isinstance(state, int):
+            state = {"pid": state}  # bare PID written by older versions
+        pid = int(state["pid"])
+    except (ValueError, KeyError, TypeError):
         PID_FILE.unlink(missing_ok=True)
         print("Invalid PID file.", file=sys.stderr)
         return None
 
     try:
-        os.kill(pid, 2)  # SIGINT for ffmpeg to gracefully stop
+        os.kill(pid, signal.SIGINT)  # lets ffmpeg finish the file gracefully
     except ProcessLookupError:
         print(f"Recorder process {pid} not found.", file=sys.stderr)
     finally:
         PID_FILE.unlink(missing_ok=True)
 
-    # Wait briefly to ensure file flush
-    time.sleep(1)
+    # ffmpeg finalises the wav header on exit, so wait for that rather than a fixed delay
+    _wait_for_exit(pid, RECORDER_EXIT_TIMEOUT)
+    if "start_ts" in state:
+        print(f"Recorded {time.time() - state['start_ts']:.1f}s of audio")
+
+    if state.get("memory"):
+        return _finish_memory_recording()
+    if "segments_dir" in state:
+        segments_dir = Path(state["segments_dir"])
+        return segments_dir if segments_dir.is_dir() else None
+    if "wav" in state:
+        wav_path = Path(state["wav"])
+        return wav_path if wav_path.exists() else None
 
     # Find latest wav in TMP_DIR
-    wav_files = sorted(TMP_DIR.glob("dictation_*.wav"), key=os.path.getmtime)
-    return wav_files[-1] if wav_files else None
+    return max(TMP_DIR.glob("dictation_*.wav"), key=os.path.getmtime, default=None)
 
 
-def load_whisper_model() -> WhisperModel:
-    """Load the Whisper model."""
-    print(f"Loading Whisper model ({WHISPER_MODEL_SIZE}, {WHISPER_COMPUTE_TYPE})...")
-    start = time.time()
+@functools.lru_cache(maxsize=1)
+def whisper_device() -> str:
+    """Resolve WHISPER_DEVICE: "auto" picks CUDA when CTranslate2 can see a GPU, else the CPU."""
+    if WHISPER_DEVICE != "auto":
+        return WHISPER_DEVICE
+    try:
+        import ctranslate2
+
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    except Exception:
+        return "cpu"
+
+
+@functools.lru_cache(maxsize=None)
+def whisper_compute_type(device: Optional[str] = None) -> str:
+    """Resolve WHISPER_COMPUTE_TYPE for the device (default: whisper_device()), picking the
+    fastest supported int8 variant for "auto".
+
+    int8_* types keep int8 weights but compute the remaining layers in higher precision.
+    """
+    device = device or whisper_device()
+    if not WHISPER_COMPUTE_TYPE:
+        return "float16" if device == "cuda" else "int8"
+    if WHISPER_COMPUTE_TYPE != "auto":
+        return WHISPER_COMPUTE_TYPE
+    try:
+        import ctranslate2
+
+        supported = ctranslate2.get_supported_compute_types(device)
+    except Exception as e:
+        print(f"Could not query supported compute types: {str(e)}")
+        return "int8"
+    preferred = ("int8_float16", "float16", "int8") if device == "cuda" else ("int8_bfloat16", "int8_float32", "int8")
+    for compute_type in preferred:
+        if compute_type in supported:
+            return compute_type
+    return "default"
+
+
+def _model_path(compute_type: str) -> str:
+    """The copy of the model pre-quantized by convert-whisper-model.sh if there is one, else the hub name."""
+    converted = CT2_MODEL_DIR / f"{WHISPER_MODEL_SIZE}-{compute_type}"
+    return str(converted) if (converted / "model.bin").exists() else WHISPER_MODEL_SIZE
+
+
+def _build_whisper_model(device: str) -> WhisperModel:
+    """Construct the Whisper model on device; on CUDA, prove it can actually transcribe."""
+    from faster_whisper import WhisperModel
+
+    compute_type = whisper_compute_type(device)
+    model_path = _model_path(compute_type)
+    cpu_threads = WHISPER_CPU_THREADS or len(os.sched_getaffinity(0))
+    print(f"Loading Whisper model ({model_path}, {device}, {compute_type})...")
     model = WhisperModel(
-        WHISPER_MODEL_SIZE,
-        device="cpu",
-        compute_type=WHISPER_COMPUTE_TYPE,
-        num_workers=4,
-        cpu_threads=4
+        model_path,
+        device=device,
+        compute_type=compute_type,
+        # One utterance at a time, so one model replica; the daemon may also serve
+        # segment transcriptions while a stop is in progress
+        num_workers=2 if IN_DAEMON else 1,
+        cpu_threads=cpu_threads
     )
+    if device == "cuda":
+        # Missing cuBLAS/cuDNN libraries usually only surface on the first transcribe
+        import numpy as np
+
+        segments, _ = model.transcribe(np.zeros(SAMPLE_RATE // 5, dtype=np.float32), language="en")
+        list(segments)
+    return model
+
+
+@functools.lru_cache(maxsize=1)
+def load_whisper_model() -> WhisperModel:
+    """Load the Whisper model, preferring a copy pre-quantized by convert-whisper-model.sh.
+
+    Falls back to the CPU when the model can't be loaded or run on CUDA (missing CUDA
+    libraries, no efficient float16 support).
+    """
+    device = whisper_device()
+    start = time.time()
+    try:
+        model = _build_whisper_model(device)
+    except Exception as e:
+        if device != "cuda":
+            raise
+        print(f"Could not use CUDA ({str(e)}), falling back to the CPU")
+        model = _build_whisper_model("cpu")
     load_time = time.time() - start
     print(f"Model loaded in {load_time:.2f}s")
     return model
 
 
-def transcribe_local(wav_path: Path) -> str:
-    """Transcribe audio using local faster-whisper."""
+def warm_model_files() -> None:
+    """Read the local Whisper model's files into the page cache.
+
+    Run in a background process by record_start (the `_warm-model` command), so the model load
+    at stop reads from memory instead of disk. Only reads files already on disk.
+    """
+    model_path = _model_path(whisper_compute_type())
+    if model_path != WHISPER_MODEL_SIZE:
+        model_dir = Path(model_path)
+    else:
+        from faster_whisper.utils import download_model
+
+        try:
+            model_dir = Path(download_model(WHISPER_MODEL_SIZE, local_files_only=True))
+        except Exception:
+            return  # not downloaded yet; the load at stop fetches it
+    buf = bytearray(1 << 20)
+    for path in model_dir.iterdir():
+        if path.is_file():
+            with open(path, "rb", buffering=0) as f:
+                while f.readinto(buf):
+                    pass
+
+
+@functools.lru_cache(maxsize=1)
+def load_transcriber():
+    """Return what transcribe_local calls .transcribe() on.
+
+    A BatchedInferencePipeline around the model (faster-whisper >= 1.1) when WHISPER_BATCH_SIZE
+    is above 1, otherwise the model itself.
+    """
     model = load_whisper_model()
+    if WHISPER_BATCH_SIZE > 1:
+        try:
+            from faster_whisper import BatchedInferencePipeline
+        except ImportError:
+            print("Batched inference needs faster-whisper >= 1.1, transcribing sequentially")
+        else:
+            return BatchedInferencePipeline(model=model)
+    return model
+
+
+def warm_up_transcriber() -> None:
+    """Run 200ms of silence through the transcriber so faster-whisper builds its Silero VAD
+    session (cached per process) before the first real dictation rather than during it."""
+    import numpy as np
+
+    try:
+        segments, _ = load_transcriber().transcribe(
+            np.zeros(SAMPLE_RATE // 5, dtype=np.float32), language="en", vad_filter=True
+        )
+        list(segments)
+    except Exception as e:
+        print(f"Transcriber warm-up failed: {str(e)}")
+
+
+def _transcribe_via_daemon(wav_path: Path,
+                           on_segment: Optional[Callable[[str], None]] = None) -> Optional[tuple]:
+    """Have a running daemon, which keeps the model loaded, transcribe a wav file.
+
+    With on_segment, the daemon streams each decoded segment back (one {"segment": ...} JSON
+    line each) and on_segment is called with it. Returns (text, transcribe_seconds), or None
+    if no daemon answered.
+    """
+    if IN_DAEMON or not SOCKET_PATH.exists():
+        return None
+    command = "transcribe-stream" if on_segment is not None else "transcribe"
+    segments_seen = False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(SEGMENT_WAIT_TIMEOUT)
+            sock.connect(str(SOCKET_PATH))
+            sock.sendall(f"{command} {wav_path.resolve()}\n".encode("utf-8"))
+            with sock.makefile("rb") as f:
+                reply = json.loads(f.readline())  # "error: ..." lines fail here too
+                while "segment" in reply:
+                    segments_seen = True
+                    on_segment(reply["segment"])
+                    reply = json.loads(f.readline())
+        text, transcribe_time = reply["text"], reply["transcribe_seconds"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        if segments_seen:
+            # Segments were already passed on, so transcribing again here would repeat them
+            raise RuntimeError(f"Daemon transcription failed part-way: {str(e)}") from e
+        return None
+    print(f"Whisper result (daemon, {transcribe_time:.2f}s):", text)
+    return text, transcribe_time
+
+
+def _audio_seconds(audio: Union[Path, io.BytesIO, np.ndarray]) -> float:
+    """Estimate a recording's length from its size (16 kHz mono 16-bit wav, or float samples)."""
+    if isinstance(audio, Path):
+        nbytes = audio.stat().st_size - 44
+    elif isinstance(audio, io.BytesIO):
+        nbytes = audio.getbuffer().nbytes - 44
+    else:
+        return len(audio) / SAMPLE_RATE
+    return max(nbytes, 0) / (SAMPLE_RATE * 2)
+
+
+def _peak_frame_rms(audio: Union[Path, io.BytesIO, np.ndarray]) -> Optional[float]:
+    """Return the loudest 30 ms frame's RMS level in 16-bit sample units, or None if it can't be measured.
+
+    Per-frame levels, unlike one RMS over the whole recording, aren't dragged down by pauses.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    try:
+        if isinstance(audio, (Path, io.BytesIO)):
+            with wave.open(str(audio) if isinstance(audio, Path) else audio, "rb") as w:
+                samples = np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+            if isinstance(audio, io.BytesIO):
+                audio.seek(0)
+        else:
+            samples = audio * 32768.0
+    except (OSError, EOFError, wave.Error):
+        return None
+    if not samples.size:
+        return 0.0
+    frame = SAMPLE_RATE * 30 // 1000
+    frames = samples[:samples.size // frame * frame].astype(np.float32).reshape(-1, frame)
+    if not frames.size:
+        frames = samples.astype(np.float32).reshape(1, -1)
+    return float(np.sqrt(np.einsum("ij,ij->i", frames, frames).max() / frames.shape[1]))
+
+
+def _save_recording(audio: Union[io.BytesIO, np.ndarray]) -> Path:
+    """Write an in-memory recording to TMP_DIR as a wav file."""
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    path = TMP_DIR / f"dictation_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
+    if isinstance(audio, io.BytesIO):
+        path.write_bytes(audio.getvalue())
+    else:
+        with wave.open(str(path), "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes((audio * 32767.0).astype("<i2").tobytes())
+    return path
+
+
+def _beam_size(audio: Union[Path, io.BytesIO, np.ndarray]) -> int:
+    """WHISPER_BEAM_SIZE if set, else greedy decoding for short dictations and a beam of 5 beyond that."""
+    if WHISPER_BEAM_SIZE > 0:
+        return WHISPER_BEAM_SIZE
+    try:
+        return 1 if _audio_seconds(audio) < SHORT_AUDIO_SECONDS else 5
+    except OSError:
+        return 5
+
+
+def transcribe_local(wav_path: Union[Path, io.BytesIO, np.ndarray],
+                     on_segment: Optional[Callable[[str], None]] = None) -> str:
+    """Transcribe audio using local faster-whisper (through the daemon when one is running).
+
+    on_segment, if given, is called with each segment's text as it is decoded.
+    """
+    if isinstance(wav_path, Path):
+        result = _transcribe_via_daemon(wav_path, on_segment)
+        if result is not None:
+            return result
+
+    transcriber = load_transcriber()
+    batch_args = {}
+    # Silence was already trimmed by ffmpeg; the batched pipeline still uses VAD to split chunks
+    vad_filter = not TRIM_SILENCE
+    if transcriber is not load_whisper_model():  # batched pipeline (both calls are cached)
+        batch_args["batch_size"] = WHISPER_BATCH_SIZE
+        vad_filter = True
 
     print("Transcribing with local Whisper…")
     start = time.time()
 
-    segments, info = model.transcribe(
-        str(wav_path),
-        beam_size=5,
+    segments, info = transcriber.transcribe(
+        str(wav_path) if isinstance(wav_path, Path) else wav_path,
+        beam_size=_beam_size(wav_path),
+        # Retry at 0.2 when a greedy pass fails the compression/log-prob checks, rather than
+        # walking faster-whisper's full 0.0-1.0 fallback ladder, and sample once on that retry
+        # instead of the default best_of=5
+        temperature=[0.0, 0.2],
+        best_of=1,
         language="en",
         condition_on_previous_text=False,
-        vad_filter=True,
-        vad_parameters=dict(min_silence_duration_ms=500)
+        vad_filter=vad_filter,
+        vad_parameters=dict(min_silence_duration_ms=500),
+        **batch_args
     )
 
-    # Collect all segments
+    # Collect all segments (decoding happens lazily as the generator is consumed)
     text_segments = []
     for segment in segments:
         text_segments.append(segment.text)
+        if on_segment is not None:
+            on_segment(segment.text)
 
     text = " ".join(text_segments).strip()
 
@@ -400,19 +1353,24 @@ def transcribe_local(wav_path: Path) -> str:
     return text, transcribe_time
 
 
-def transcribe_api(wav_path: Path) -> str:
+def transcribe_api(wav_path: Union[Path, io.BytesIO]) -> str:
     """Transcribe audio using OpenAI Whisper API."""
+    import httpx
+
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         notify("Whisper Dictation", "OPENAI_API_KEY not set", 5000)
         sys.exit(1)
 
-    client = OpenAI(api_key=api_key)
+    # The upload and transcription grow with the recording, so allow a second per second of audio
+    # on top of the shared client's 30s
+    client = _get_openai_client().with_options(
+        timeout=httpx.Timeout(30.0 + _audio_seconds(wav_path), connect=3.0))
 
     print("Transcribing with OpenAI Whisper API…")
     start = time.time()
 
-    with wav_path.open("rb") as audio_file:
+    with (wav_path if isinstance(wav_path, io.BytesIO) else wav_path.open("rb")) as audio_file:
         resp = client.audio.transcriptions.create(
             model="whisper-1",
             file=audio_file,
@@ -426,76 +1384,547 @@ def transcribe_api(wav_path: Path) -> str:
     return text, transcribe_time
 
 
-def transcribe_audio(wav_path: Path) -> tuple:
+def transcribe_audio(wav_path: Union[Path, io.BytesIO, np.ndarray],
+                     on_segment: Optional[Callable[[str], None]] = None) -> tuple:
     """Transcribe audio using configured mode (local or API). Returns (text, transcribe_seconds)."""
     if WHISPER_MODE == "api":
         return transcribe_api(wav_path)
     else:
-        return transcribe_local(wav_path)
+        return transcribe_local(wav_path, on_segment)
+
+
+def _transcribe_segment(segment: Path) -> Optional[str]:
+    """Transcribe one recording segment, returning None on failure so later segments still run
+    and finish_segments knows to retry it."""
+    try:
+        return transcribe_audio(segment)[0]
+    except (Exception, SystemExit) as e:  # transcribe_api exits when OPENAI_API_KEY is missing
+        print(f"Failed to transcribe {segment.name}: {str(e)}", file=sys.stderr)
+        return None
+
+
+def transcribe_segments(segments_dir: Path) -> None:
+    """Transcribe segments as ffmpeg closes them (runs as a background process during recording).
+
+    A segment is complete once ffmpeg has moved on to the next one. record_stop writes a
+    STOP marker after ffmpeg has exited, at which point every remaining segment is complete.
+    Results are appended in order to transcripts.jsonl, with "text": null for failed segments.
+    """
+    stop_marker = segments_dir / "STOP"
+    # API calls can overlap; local transcription is CPU-bound so one at a time
+    workers = 4 if WHISPER_MODE == "api" else 1
+    futures = []
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool, \
+            (segments_dir / "transcripts.jsonl").open("a", encoding="utf-8") as out:
+        while True:
+            stopping = stop_marker.exists()
+            segments = sorted(segments_dir.glob("segment_*.wav"))
+            complete = segments if stopping else segments[:-1]
+            for segment in complete[len(futures):]:
+                futures.append(pool.submit(_transcribe_segment, segment))
+
+            while written < len(futures) and futures[written].done():
+                out.write(json.dumps({"index": written, "text": futures[written].result()}) + "\n")
+                out.flush()
+                written += 1
+
+            if stopping and written == len(futures):
+                return
+            time.sleep(SEGMENT_POLL_SECONDS)
+
+
+def finish_segments(segments_dir: Path) -> tuple:
+    """Wait for the segment transcriber and return (combined text, seconds spent after stop).
+
+    Any segment the background process didn't get to (crash or timeout) or failed on is
+    transcribed here; a failure this time raises rather than dropping part of the dictation.
+    """
+    start = time.time()
+    (segments_dir / "STOP").touch()
+
+    try:
+        watcher_pid = int((segments_dir / "watcher.pid").read_text().strip())
+    except (OSError, ValueError):
+        watcher_pid = None
+    deadline = start + SEGMENT_WAIT_TIMEOUT
+    while watcher_pid and _pid_alive(watcher_pid) and time.time() < deadline:
+        time.sleep(SEGMENT_POLL_SECONDS / 5)
+    if watcher_pid and _pid_alive(watcher_pid):
+        print("Segment transcriber timed out, finishing remaining segments here", file=sys.stderr)
+        try:
+            os.kill(watcher_pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    texts = {}
+    try:
+        with (segments_dir / "transcripts.jsonl").open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # partial line from an interrupted write
+                texts[entry["index"]] = entry["text"]
+    except FileNotFoundError:
+        pass
+
+    segments = sorted(segments_dir.glob("segment_*.wav"))
+    for index, segment in enumerate(segments):
+        if texts.get(index) is None:
+            if index in texts:
+                print(f"Retrying {segment.name}, which failed during recording")
+            texts[index] = transcribe_audio(segment)[0]
+
+    text = " ".join(texts[i].strip() for i in range(len(segments)) if texts[i].strip())
+    transcribe_time = time.time() - start
+    print(f"Whisper result ({len(segments)} segments, {transcribe_time:.2f}s after stop):", text)
+    return text, transcribe_time
+
+
+def _cleanup_cache_path(system_messages: tuple, raw_text: str) -> Path:
+    """Return the cache file for a cleanup request, keyed by model, system messages and input text."""
+    system = [m["content"] for m in system_messages]
+    key = hashlib.sha256(
+        json.dumps({"m": cleanup_model_name(), "s": system, "u": raw_text}, sort_keys=True).encode()
+    ).hexdigest()
+    return CACHE_DIR / f"{key}.txt"
 
 
-def cleanup_text(raw_text: str, cleanup_enabled: bool) -> tuple:
-    """Clean up text using LLM if enabled."""
+def _cache_lookup(path: Path) -> Optional[str]:
+    """Return a cached cleanup result, or None on a miss (or when caching is disabled)."""
+    if CACHE_MAX_BYTES <= 0:
+        return None
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+    try:
+        os.utime(path)  # mark as recently used for eviction
+    except OSError:
+        pass
+    return text
+
+
+def _cache_store(path: Path, text: str) -> None:
+    """Store a cleanup result, then evict least-recently-used entries above WHISPER_CACHE_MB."""
+    if CACHE_MAX_BYTES <= 0:
+        return
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+        entries = []
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file():
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total <= CACHE_MAX_BYTES:
+                break
+            os.unlink(entry_path)
+            total -= size
+    except OSError as e:
+        # Never let caching errors break dictation flow
+        print(f"Cache error (non-fatal): {str(e)}")
+
+
+def _looks_clean(text: str) -> bool:
+    """Whether Whisper's output already reads as finished text (WHISPER_CLEANUP_SKIP_CLEAN)."""
+    return (len(text) < ALREADY_CLEAN_MAX_CHARS
+            and "  " not in text
+            and _ALREADY_CLEAN_RE.fullmatch(text) is not None
+            and _FILLER_RE.search(text) is None)
+
+
+# A llama.cpp model can only run one generation at a time (overlapped cleanup and the daemon share it)
+_cleanup_llm_lock = threading.Lock()
+
+
+def _local_cleanup_deltas(llm, messages: List[Dict[str, str]]):
+    """Yield streamed text deltas from the local cleanup model.
+
+    Raises ValueError before generating anything if the prompt leaves too little room in the
+    context window for the cleaned text.
+    """
+    with _cleanup_llm_lock:
+        # Approximate the chat template's overhead with a few tokens per message
+        counts = [len(llm.tokenize(m["content"].encode("utf-8"), add_bos=False)) + 8 for m in messages]
+        room = llm.n_ctx() - sum(counts)
+        # The cleaned text is about as long as the dictation; leave some slack on top
+        if room < counts[-1] + 16:
+            raise ValueError(f"dictation does not fit the {llm.n_ctx()}-token context (CLEANUP_LOCAL_CTX)")
+        for chunk in llm.create_chat_completion(messages=messages, temperature=0, top_p=0.05,
+                                                max_tokens=min(2 * counts[-1] + 16, room), stream=True):
+            if chunk["choices"]:
+                yield chunk["choices"][0]["delta"].get("content")
+
+
+def cleanup_text(raw_text: str, cleanup_enabled: bool,
+                 window_info: Optional[Dict[str, Optional[str]]] = None,
+                 on_delta: Optional[Callable[[str], None]] = None,
+                 cleanup_client: Optional[tuple] = None) -> tuple:
+    """Clean up text using LLM if enabled.
+
+    window_info may be passed in when it was already looked up (e.g. while transcribing).
+    on_delta, if given, is called with each streamed chunk of the cleanup response.
+    cleanup_client is a (client, missing_key) pair from prewarm_cleanup_client().
+    """
+    global _cleanup_last_used
     # Get the active window info (always, for logging and context matching)
-    window_info = get_active_window_info()
+    if window_info is None:
+        window_info = get_active_window_info()
     window_name = window_info.get("name")
 
     if not cleanup_enabled:
         print("Cleanup disabled, using raw transcription")
         return raw_text, window_name, False, 0.0
 
-    # Get appropriate client for the configured model
-    client, missing_key = get_cleanup_client()
-    if not client:
-        print(f"Warning: {missing_key} not set, skipping cleanup")
-        return raw_text, window_name, False, 0.0
+    # Not worth an API round trip: empty or very short input, or (opt-in) already well-formed
+    stripped = raw_text.strip()
+    if len(stripped.split()) < CLEANUP_MIN_WORDS:
+        print("Transcription too short, skipping cleanup")
+        return stripped, window_name, False, 0.0
+    if CLEANUP_SKIP_CLEAN and _looks_clean(stripped):
+        print("Transcription already looks clean, skipping cleanup")
+        return stripped, window_name, False, 0.0
 
     # Start with base system prompt
-    system_prompt = SYSTEM_PROMPT_CLEANUP
+    system_messages = (_BASE_SYSTEM_MESSAGE,)
 
-    # Check if any context rules match the current window
-    extra_context = get_context_for_window(window_info)
+    # Check if any context rules match the current window. Their extra context goes in a second
+    # system message (built at config load), so every request shares the same cacheable prefix
+    match = _match_context_rule(window_info)
+    extra_context = match[1].get("extra_context") if match else None
     if extra_context:
         print(f"Adding extra context for window: {window_name}")
-        system_prompt += "\n\n" + extra_context
+        system_messages = match[1]["_system_messages"]
 
     cleanup_start = time.time()
-    resp = client.chat.completions.create(
-        model=CLEANUP_MODEL,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": raw_text},
-        ],
-        temperature=0,
-        top_p=0.05
-    )
+    cache_path = _cleanup_cache_path(system_messages, raw_text)
+    cached = _cache_lookup(cache_path)
+    if cached is not None:
+        cleanup_time = time.time() - cleanup_start
+        print(f"Cleanup result (cached, {cleanup_time:.2f}s):", cached)
+        return cached, window_name, extra_context is not None, cleanup_time
+
+    # Get appropriate client for the configured model
+    client, missing_key = cleanup_client or get_cleanup_client()
+    if not client:
+        print(f"Warning: {missing_key} not set or unusable, skipping cleanup")
+        return raw_text, window_name, False, 0.0
+
+    messages = [
+        *system_messages,
+        {"role": "user", "content": raw_text},
+    ]
+    if CLEANUP_BACKEND == "local":
+        deltas = _local_cleanup_deltas(client, messages)
+    else:
+        stream = client.chat.completions.create(
+            model=CLEANUP_MODEL,
+            messages=messages,
+            temperature=0,
+            top_p=0.05,
+            stream=True,
+            # Route all cleanup requests (same static prefix) to the same OpenAI prompt cache
+            extra_body=None if "/" in CLEANUP_MODEL else {"prompt_cache_key": "dictation-cleanup"},
+        )
+        deltas = (chunk.choices[0].delta.content for chunk in stream if chunk.choices)
+        _cleanup_last_used = time.time()
+    # Accumulate streamed deltas; tokens arrive as they are generated rather than all at the end
+    parts = []
+    first_token_time = None
+    try:
+        for delta in deltas:
+            if delta:
+                if first_token_time is None:
+                    first_token_time = time.time() - cleanup_start
+                parts.append(delta)
+                if on_delta is not None:
+                    on_delta(delta)
+    except Exception as e:
+        # A local model failure falls back to the raw text, unless part of the output was already typed
+        if CLEANUP_BACKEND != "local" or (parts and on_delta is not None):
+            raise
+        print(f"Warning: local cleanup failed ({str(e)}), using raw transcription")
+        return raw_text, window_name, False, 0.0
     cleanup_time = time.time() - cleanup_start
-    cleaned = resp.choices[0].message.content.strip()
+    cleaned = "".join(parts).strip()
+    if first_token_time is not None:
+        print(f"Cleanup first token after {first_token_time:.2f}s")
     print(f"Cleanup result ({cleanup_time:.2f}s):", cleaned)
+    if cleaned:
+        _cache_store(cache_path, cleaned)
     return cleaned, window_name, extra_context is not None, cleanup_time
 
 
-def copy_and_paste(text: str) -> None:
-    subprocess.run(["xclip", "-selection", "clipboard"], input=text.encode(), check=False)
-    window_info = get_active_window_info()
+# Modifier names used in paste_key mapped to X keysym names
+_KEY_ALIASES = {
+    "ctrl": "Control_L",
+    "control": "Control_L",
+    "shift": "Shift_L",
+    "alt": "Alt_L",
+    "super": "Super_L",
+    "meta": "Meta_L",
+}
+
+
+def _held_modifiers(d) -> List[int]:
+    """Return the keycodes of modifier keys currently held down."""
+    keymap = d.query_keymap()
+    return [keycode for keycodes in d.get_modifier_mapping() for keycode in keycodes
+            if keycode and keymap[keycode // 8] & (1 << (keycode % 8))]
+
+
+def _send_key_xtest(key_combo: str) -> bool:
+    """Press a key combination like "ctrl+shift+v" in-process via the XTEST extension.
+
+    Like xdotool's --clearmodifiers, modifiers the user is still holding are released for
+    the key press and pressed again afterwards.
+
+    Returns False if python-xlib/XTEST is unavailable, a key can't be mapped or the X
+    connection fails, so the caller can fall back to xdotool.
+    """
+    d = _get_display()
+    if d is None:
+        return False
+    try:
+        if not d.has_extension("XTEST"):
+            return False
+
+        keycodes = []
+        for name in key_combo.split("+"):
+            keysym = XK.string_to_keysym(_KEY_ALIASES.get(name.lower(), name))
+            keycode = d.keysym_to_keycode(keysym) if keysym else 0
+            if not keycode:
+                return False
+            keycodes.append(keycode)
+
+        held = [keycode for keycode in _held_modifiers(d) if keycode not in keycodes]
+        for keycode in held:
+            xtest.fake_input(d, X.KeyRelease, keycode)
+        for keycode in keycodes:
+            xtest.fake_input(d, X.KeyPress, keycode)
+        for keycode in reversed(keycodes):
+            xtest.fake_input(d, X.KeyRelease, keycode)
+        for keycode in held:
+            xtest.fake_input(d, X.KeyPress, keycode)
+        d.sync()
+        return True
+    except Exception as e:
+        print(f"Failed to send {key_combo} via XTEST: {str(e)}")
+        _reset_display()
+        return False
+
+
+def copy_and_paste(text: str, window_info: Optional[Dict[str, Optional[str]]] = None) -> None:
+    """Insert text into the focused window. window_info, if given, picks the paste key."""
+    if PASTE_MODE == "type":
+        # One process and the user's clipboard is left alone; paste_key rules don't apply
+        subprocess.run(["xdotool", "type", "--clearmodifiers", "--delay", "0", "--file", "-"],
+                       input=text.encode(), check=False, stdout=_DEVNULL_FD, close_fds=False)
+        return
+
+    # xclip forks a background process that keeps owning the clipboard after we exit
+    xclip = subprocess.Popen(["xclip", "-selection", "clipboard"], stdin=subprocess.PIPE,
+                             stdout=_DEVNULL_FD, close_fds=False)
+    xclip.stdin.write(text.encode())
+    xclip.stdin.close()  # EOF: xclip takes the selection while we look up the paste key
+    if window_info is None:
+        window_info = get_active_window_info()
     paste_key = get_paste_key_for_window(window_info)
-    subprocess.run(["xdotool", "key", paste_key], check=False)
+    # The clipboard must be owned before the paste key is pressed
+    xclip.wait()
+    if not _send_key_xtest(paste_key):
+        subprocess.run(["xdotool", "key", "--clearmodifiers", paste_key], check=False, **_QUIET)
+
+
+class OverlappedCleanup:
+    """Cleans up finished sentences while Whisper is still decoding (WHISPER_CLEANUP_OVERLAP_WORDS).
+
+    Decoded segments are collected until they hold at least CLEANUP_OVERLAP_WORDS words and
+    end a sentence; that piece is then cleaned up on the pool while decoding continues.
+    """
+
+    def __init__(self, pool: ThreadPoolExecutor, window_future, cleanup_client_future) -> None:
+        self.pool = pool
+        self.window_future = window_future
+        self.cleanup_client_future = cleanup_client_future
+        self.pending: List[str] = []
+        self.futures = []
+
+    def feed(self, segment_text: str) -> None:
+        self.pending.append(segment_text.strip())
+        text = " ".join(t for t in self.pending if t)
+        if len(text.split()) >= CLEANUP_OVERLAP_WORDS and text.endswith((".", "!", "?")):
+            self._submit(text)
+
+    def _submit(self, text: str) -> None:
+        self.pending = []
+        self.futures.append(self.pool.submit(
+            lambda: cleanup_text(text, True, self.window_future.result(),
+                                 cleanup_client=self.cleanup_client_future.result())))
+
+    def finish(self) -> Optional[tuple]:
+        """Clean up the remainder and return cleanup_text-style results for the whole text.
+
+        Returns None if nothing was started during decoding, so the caller can clean up normally.
+        """
+        if not self.futures:
+            return None
+        start = time.time()
+        text = " ".join(t for t in self.pending if t)
+        if text:
+            self._submit(text)
+        results = [future.result() for future in self.futures]
+        cleaned = " ".join(r[0] for r in results if r[0])
+        cleanup_time = time.time() - start
+        print(f"Cleanup result ({len(results)} pieces, {cleanup_time:.2f}s after transcription):", cleaned)
+        return cleaned, results[0][1], any(r[2] for r in results), cleanup_time
+
+
+class SentenceTyper:
+    """Types streamed text into the focused window one sentence at a time (WHISPER_PASTE_MODE=stream).
+
+    Long sentences are flushed early, at a word boundary, once STREAM_FLUSH_CHARS are pending.
+
+    Each sentence is a single `xdotool type` call; xdotool reads --file input until EOF,
+    so one long-lived process can't be fed incrementally.
+    """
+
+    def __init__(self) -> None:
+        self.pending = ""
+        self.started = False
+
+    def feed(self, delta: str) -> None:
+        self.pending += delta
+        last_end = None
+        for match in _SENTENCE_END_RE.finditer(self.pending):
+            last_end = match.end()
+        if last_end is None and len(self.pending) >= STREAM_FLUSH_CHARS:
+            # The space stays pending, so the next chunk starts with it and no trailing space is typed
+            space = self.pending.rfind(" ")
+            if space > 0:
+                last_end = space
+        if last_end is not None:
+            self._type(self.pending[:last_end])
+            self.pending = self.pending[last_end:]
+
+    def finish(self, final_text: str) -> None:
+        """Type whatever is left; if nothing was streamed (cache hit, cleanup off), type final_text."""
+        if self.started:
+            self._type(self.pending.rstrip())
+        else:
+            self._type(final_text)
+        self.pending = ""
+
+    def _type(self, text: str) -> None:
+        if not self.started:
+            text = text.lstrip()  # the final result is stripped, so match it
+        if not text:
+            return
+        self.started = True
+        subprocess.run(["xdotool", "type", "--clearmodifiers", "--delay", "0", "--", text],
+                       check=False, **_QUIET)
+
+
+# Append-only log file descriptor, opened on first use and kept for the life of the process
+_log_fd: Optional[int] = None
+# Log entries are serialised and written by a background thread; None tells it to stop
+_log_queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+_log_thread: Optional[threading.Thread] = None
+_log_thread_lock = threading.Lock()
+
+
+def _get_log_fd() -> int:
+    """Return the dictation log fd, opening it (O_APPEND) on first use.
+
+    The fd is reopened if the log was deleted or rotated away underneath a long-lived daemon.
+    """
+    global _log_fd
+    log_path = LOG_DIR / "dictation_log.jsonl"
+    if _log_fd is not None:
+        # Rotation renames or deletes the file; either way the path no longer names our fd's file
+        opened = os.fstat(_log_fd)
+        try:
+            current = os.stat(log_path)
+            rotated = (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino)
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            os.close(_log_fd)
+            _log_fd = None
+    if _log_fd is None:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        _log_fd = os.open(
+            str(log_path),
+            os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC,
+            0o644,
+        )
+    return _log_fd
+
+
+def _json_line(entry: Dict[str, Any]) -> bytes:
+    """Serialise a log entry as one UTF-8 JSON line (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(entry) + b"\n"
+    return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def _log_worker() -> None:
+    """Write queued log entries, batching whatever has piled up into a single write."""
+    while True:
+        batch = [_log_queue.get()]
+        while True:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        data = b"".join(_json_line(entry) for entry in batch if entry is not None)
+        if data:
+            try:
+                # A single O_APPEND write keeps each line intact even with concurrent writers
+                os.write(_get_log_fd(), data)
+            except Exception as e:
+                print(f"Logging error (non-fatal): {str(e)}")
+        if None in batch:
+            return
+
+
+def _flush_log() -> None:
+    """Wait for queued log entries to be written, then close the log (runs at exit)."""
+    _log_queue.put(None)
+    _log_thread.join(timeout=5)
+    if _log_fd is not None:
+        os.close(_log_fd)
+
+
+def _enqueue_log(entry: Dict[str, Any]) -> None:
+    """Hand a log entry to the writer thread, starting it on first use."""
+    global _log_thread
+    with _log_thread_lock:
+        if _log_thread is None:
+            _log_thread = threading.Thread(target=_log_worker, name="dictation-log", daemon=True)
+            _log_thread.start()
+            atexit.register(_flush_log)
+    _log_queue.put(entry)
 
 
 def log_dictation(raw: str, cleaned: str, window_name: Optional[str], extra_context_applied: bool,
                    transcribe_seconds: float = 0.0, cleanup_seconds: float = 0.0) -> None:
-    """Append a JSON line with raw & cleaned text, context, and timing."""
+    """Append a JSON line with raw & cleaned text, context, and timing (written in the background)."""
     if not LOG_ENABLED:
         return
 
     try:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
-
         entry = {
             "timestamp": datetime.datetime.utcnow().isoformat(timespec="seconds"),
             "whisper_mode": WHISPER_MODE,
             "whisper_model_size": WHISPER_MODEL_SIZE if WHISPER_MODE == "local" else None,
-            "cleanup_model": CLEANUP_MODEL,
+            "cleanup_model": cleanup_model_name(),
             "raw_text": raw,
             "cleaned_text": cleaned,
             "timing": {
@@ -508,12 +1937,8 @@ def log_dictation(raw: str, cleaned: str, window_name: Optional[str], extra_cont
                 "extra_context_applied": extra_context_applied
             }
         }
-        
-        log_path = LOG_DIR / "dictation_log.jsonl"
-        with log_path.open("a", encoding="utf-8") as f:
-            json.dump(entry, f, ensure_ascii=False)
-            f.write("\n")
-            
+        _enqueue_log(entry)
+
         print(f"Dictation logged with window: {window_name or 'Unknown'}, extra context: {extra_context_applied}")
     except Exception as e:
         # Never let logging errors break dictation flow
@@ -526,33 +1951,100 @@ def record_stop(cleanup_enabled: bool) -> None:
     if wav_path is None:
         return
 
+    # Accidental activations record near-silence; don't spend a transcription and cleanup on them.
+    # The recording is kept (until the stale-recording sweep) in case the gate misfired.
+    if SILENCE_RMS > 0 and not (isinstance(wav_path, Path) and wav_path.is_dir()):
+        level = _peak_frame_rms(wav_path)
+        if level is not None and level < SILENCE_RMS:
+            if not isinstance(wav_path, Path):
+                wav_path = _save_recording(wav_path)
+            print(f"Peak level {level:.0f} RMS is below WHISPER_SILENCE_RMS, skipping; kept {wav_path}")
+            notify("Whisper Dictation", "No speech detected", 2000)
+            return
+
     notify("Whisper Dictation", "Transcribing…", 2000)
 
     try:
-        raw_text, transcribe_seconds = transcribe_audio(wav_path)
-        final_text, window_name, extra_context_applied, cleanup_seconds = cleanup_text(raw_text, cleanup_enabled)
+        # Window lookup, context config parsing and the cleanup connection don't depend on
+        # the transcript, so set them up in the background while Whisper is busy
+        cleanup_client_future = None
+        overlapped = None
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            window_future = pool.submit(get_active_window_info)
+            if cleanup_enabled:
+                pool.submit(compiled_context_rules)
+                cleanup_client_future = pool.submit(prewarm_cleanup_client)
+            if isinstance(wav_path, Path) and wav_path.is_dir():
+                raw_text, transcribe_seconds = finish_segments(wav_path)
+            else:
+                overlap = None
+                if cleanup_enabled and CLEANUP_OVERLAP_WORDS > 0 and WHISPER_MODE == "local":
+                    overlap = OverlappedCleanup(pool, window_future, cleanup_client_future)
+                raw_text, transcribe_seconds = transcribe_audio(
+                    wav_path, on_segment=overlap.feed if overlap else None)
+                overlapped = overlap.finish() if overlap else None
+            window_info = window_future.result()
+        typer = SentenceTyper() if PASTE_MODE == "stream" else None
+        if overlapped is not None:
+            final_text, window_name, extra_context_applied, cleanup_seconds = overlapped
+        else:
+            final_text, window_name, extra_context_applied, cleanup_seconds = cleanup_text(
+                raw_text, cleanup_enabled, window_info, on_delta=typer.feed if typer else None,
+                cleanup_client=cleanup_client_future.result() if cleanup_client_future else None)
         total = transcribe_seconds + cleanup_seconds
         print(f"Pipeline: transcribe={transcribe_seconds:.2f}s cleanup={cleanup_seconds:.2f}s total={total:.2f}s")
         # Persist raw & cleaned output for future evaluation
         log_dictation(raw_text, final_text, window_name, extra_context_applied,
                       transcribe_seconds, cleanup_seconds)
-        copy_and_paste(final_text)
+        if typer:
+            typer.finish(final_text)
+        else:
+            copy_and_paste(final_text, window_info)
         notify("Whisper Dictation", "Finished!", 3000)
     except Exception as exc:
         notify("Whisper Dictation", f"Error: {exc}", 5000)
         raise
     finally:
-        # Optionally delete wav to save space
+        # Optionally delete wav (or segments directory) to save space
         try:
-            wav_path.unlink()
+            if not isinstance(wav_path, Path):
+                pass  # in-memory recording, nothing on disk
+            elif wav_path.is_dir():
+                shutil.rmtree(wav_path)
+            else:
+                wav_path.unlink()
         except Exception:
             pass
 
 
+def run_command(cmd: str, cleanup_enabled: bool) -> None:
+    """Run a start/stop/toggle command (shared by the CLI and whisper_dictation_daemon.py)."""
+    if cmd == "toggle":
+        # Check if recording is active and toggle accordingly
+        if PID_FILE.exists():
+            record_stop(cleanup_enabled)
+        else:
+            record_start()
+    elif cmd == "start":
+        record_start()
+    else:
+        record_stop(cleanup_enabled)
+
+
 def main() -> None:
     # Parse command-line arguments
     args = sys.argv[1:]
-    if not args or args[0] not in {"start", "stop", "toggle"}:
+
+    # Internal: background segment transcriber spawned by record_start in chunked mode
+    if len(args) == 2 and args[0] == "_transcribe-segments":
+        transcribe_segments(Path(args[1]))
+        return
+    # Internal: page-cache warm-up spawned by record_start in local mode
+    if args == ["_warm-model"]:
+        warm_model_files()
+        return
+
+    if not args or args[0] not in COMMANDS:
         print("Usage: whisper_dictation.py start|stop|toggle [--no-cleanup]")
         print("  start: Start recording")
         print("  stop: Stop recording and transcribe")
@@ -566,16 +2058,7 @@ def main() -> None:
     if not check_dependencies(cleanup_enabled):
         sys.exit(1)
 
-    if cmd == "toggle":
-        # Check if recording is active and toggle accordingly
-        if PID_FILE.exists():
-            record_stop(cleanup_enabled)
-        else:
-            record_start()
-    elif cmd == "start":
-        record_start()
-    else:
-        record_stop(cleanup_enabled)
+    run_command(cmd, cleanup_enabled)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""whisper_dictation_daemon.py
+
+Long-running server that keeps whisper_dictation.py warm between hotkey presses.
+
+Usage:
+    python3 whisper_dictation_daemon.py     # serve until interrupted
+
+Each connection sends one line with the same arguments as whisper_dictation.py
+(e.g. "toggle --no-cleanup"); the daemon runs the command and replies "ok" or
+"error: <message>". whisper-dictation-client.sh does this for the hotkey scripts and
+falls back to running whisper_dictation.py directly when the daemon isn't running.
+
+"transcribe <wav path>" transcribes a file with the resident local model and replies with
+one JSON line {"text": ..., "transcribe_seconds": ...}. "transcribe-stream <wav path>" first
+sends a {"segment": ...} line for each segment as it is decoded (used for overlapped cleanup).
+whisper_dictation.py uses these when it runs outside the daemon (e.g. the chunked-mode
+segment transcriber), so it doesn't have to load its own copy of the model.
+
+Python start-up, imports (openai, faster-whisper, yaml), .env, the context config and (in
+local mode) the Whisper model load are paid once when the daemon starts instead of on
+every hotkey press. Because start and
+stop are handled by the same process, audio is piped from ffmpeg into memory instead of
+being written to and read back from a wav file; in local mode the samples go straight
+to faster-whisper without being decoded again.
+
+Environment / config:
+    WHISPER_SOCKET – socket path (default: $XDG_RUNTIME_DIR/whisper_dictation.sock)
+    All other settings are read by whisper_dictation.py.
+"""
+from __future__ import annotations
+
+import fcntl
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from pathlib import Path
+
+import whisper_dictation as wd
+
+# Commands share recorder state (PID file, clipboard, focused window), so run them one at a time
+_command_lock = threading.Lock()
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Handle one command line per connection."""
+
+    def handle(self) -> None:
+        line = self.rfile.readline().decode("utf-8", "replace").strip()
+        if line.startswith(("transcribe ", "transcribe-stream ")):
+            command, path = line.split(" ", 1)
+            self._transcribe(Path(path), stream=command == "transcribe-stream")
+            return
+
+        args = line.split()
+        if not args or args[0] not in wd.COMMANDS:
+            self._reply("error: usage: start|stop|toggle [--no-cleanup]")
+            return
+
+        cleanup_enabled = wd.CLEANUP_ENABLED and "--no-cleanup" not in args
+        with _command_lock:
+            try:
+                if not wd.check_dependencies(cleanup_enabled):
+                    self._reply("error: missing dependencies (see daemon output)")
+                    return
+                wd.run_command(args[0], cleanup_enabled)
+            except Exception as e:
+                print(f"Command '{' '.join(args)}' failed: {str(e)}", file=sys.stderr)
+                self._reply(f"error: {e}")
+                return
+        self._reply("ok")
+
+    def _transcribe(self, wav_path: Path, stream: bool) -> None:
+        # Not under _command_lock: segments are transcribed while a recording is running
+        on_segment = (lambda text: self._reply(json.dumps({"segment": text}))) if stream else None
+        try:
+            text, transcribe_seconds = wd.transcribe_local(wav_path, on_segment)
+        except Exception as e:
+            print(f"Transcribing {wav_path} failed: {str(e)}", file=sys.stderr)
+            self._reply(f"error: {e}")
+            return
+        self._reply(json.dumps({"text": text, "transcribe_seconds": transcribe_seconds}))
+
+    def _reply(self, message: str) -> None:
+        try:
+            self.wfile.write(f"{message}\n".encode("utf-8"))
+        except OSError:
+            pass  # client went away
+
+
+class DictationServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def _socket_in_use(path: str) -> bool:
+    """Return True if another daemon is already listening on the socket path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+            return True
+        except OSError:
+            return False
+
+
+def _claim_daemon_lock(sock_path: str) -> bool:
+    """Take the lock file beside the socket for the life of the process.
+
+    Held from before the warm-up, so daemons autostarted while another one is still loading
+    the model exit straight away instead of loading their own copy first.
+    """
+    fd = os.open(f"{sock_path}.lock", os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    return True  # the fd stays open (and locked) until the process exits
+
+
+def _warm_up() -> None:
+    """Import the modules whisper_dictation loads lazily, parse the context config and load and warm the model up front."""
+    for module in ("openai", "faster_whisper"):
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    wd.compiled_context_rules()
+    if wd.CLEANUP_ENABLED and wd.CLEANUP_BACKEND == "local":
+        wd.get_cleanup_client()  # loads the model, or reports why it can't
+    if wd.WHISPER_MODE == "local":
+        wd.warm_up_transcriber()
+
+
+def main() -> None:
+    # start and stop both run here, so keep recordings in memory rather than in wav files
+    wd.IN_MEMORY_RECORDING = True
+    wd.IN_DAEMON = True
+
+    sock_path = str(wd.SOCKET_PATH)
+    if not _claim_daemon_lock(sock_path):
+        print(f"Daemon already running or starting on {sock_path}", file=sys.stderr)
+        sys.exit(1)
+    if os.path.exists(sock_path):
+        if _socket_in_use(sock_path):
+            print(f"Daemon already running on {sock_path}", file=sys.stderr)
+            sys.exit(1)
+        os.unlink(sock_path)  # stale socket from a previous run
+
+    _warm_up()
+
+    with DictationServer(sock_path, CommandHandler) as server:
+        os.chmod(sock_path, 0o600)
+        print(f"Whisper dictation daemon listening on {sock_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try:
+                os.unlink(sock_path)
+            except FileNotFoundError:
+                pass
+
+
+if __name__ == "__main__":
+    main()